@@ -1,13 +1,58 @@
-from flask import Flask, render_template, request, jsonify
-from utils import extract_filters, record_and_transcribe, fetch_history, generate_elastic_query, create_advanced_search_url, transcribe
-from data_analysis import  analyze_transactions_with_openai
+from flask import Flask, Request, Response, render_template, request, jsonify, stream_with_context
+from utils import extract_filters, record_and_transcribe, fetch_history, generate_elastic_query, build_filters_response, transcribe, filters_cache, transcription_cache, history_cache
+from usage import usage_stats
+from rollup import rollup_stats
+from routing import routing_stats
+from audio_processing import preprocess_upload
+from batch import process_batch, parse_batch_request, to_ndjson
+from streaming import text_events, audio_events, SSE_HEADERS
+from metrics import new_trace_id, current_trace_id, render_metrics
+from werkzeug.datastructures import FileStorage
+import io
 import os
+import tempfile
+
+
+# Uploads larger than this are rejected with a 413 while the body is streamed in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Uploaded audio stays in memory up to this size, then spills to a private temp file
+AUDIO_SPOOL_THRESHOLD = int(os.getenv("AUDIO_SPOOL_THRESHOLD", str(2 * 1024 * 1024)))
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_THRESHOLD, mode="rb+")
 
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds the {MAX_UPLOAD_BYTES} bytes limit"}), 413
+
+
+@app.before_request
+def start_trace():
+    new_trace_id(request.headers.get("X-Trace-Id"))
+
+
+@app.after_request
+def echo_trace(response):
+    """Echoes the request's trace ID in a header and in JSON bodies."""
+    trace_id = current_trace_id()
+    if trace_id:
+        response.headers["X-Trace-Id"] = trace_id
+        if response.mimetype == "application/json" and not response.is_streamed:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                body["trace_id"] = trace_id
+                response.set_data(app.json.dumps(body))
+    return response
+
 
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -25,31 +70,9 @@ def process_text():
 
     # Perform AI Analysis
     # analysis_results = analyze_transactions_with_openai(history)
-    android_url = "lydia://advanced_search"
-    ios_url = "com.lydia-app.preprod://advanced_search"
-
-    query_url_android = create_advanced_search_url(android_url, extracted_info)
-    query_url_ios = create_advanced_search_url(ios_url, extracted_info)
 
     # Return results with AI insights
-    return jsonify({
-        "clarification_needed": extracted_info.get("clarification_needed", []),
-        "clarification_options": extracted_info.get("clarification_options", []),
-        # "items": history.get("items", []),
-        # "analysis": analysis_results,  # Pass AI-generated financial insights
-        "filters": {
-            "start_date": extracted_info.get("start_date", ""),
-            "end_date": extracted_info.get("end_date", ""),
-            "amount": extracted_info.get("amount", ""),
-            "math": extracted_info.get("math_operation", ""),
-            "movement_type": extracted_info.get("movement_type", ""),
-            "pfm_category": extracted_info.get("pfm-category", ""),
-            "movement_scope": extracted_info.get("movement_scope", ""),
-            "keywords": extracted_info.get("keywords", "")
-        },
-        "query_url_android": query_url_android,
-        "query_url_ios": query_url_ios
-    })
+    return jsonify(build_filters_response(extracted_info))
 
 
 @app.route('/process_audio', methods=['POST'])
@@ -61,71 +84,81 @@ def process_audio():
         # payload = generate_elastic_query(extracted_info)
         # history = fetch_history(payload)
         # analysis_results = analyze_transactions_with_openai(history)
-        android_url = "lydia://advanced_search"
-        ios_url = "com.lydia-app.preprod://advanced_search"
 
-        query_url_android = create_advanced_search_url(android_url, extracted_info)
-        query_url_ios = create_advanced_search_url(ios_url, extracted_info)
-      
         # Return results with AI insights
-        return jsonify({
-            "clarification_needed": extracted_info.get("clarification_needed", []),
-            "clarification_options": extracted_info.get("clarification_options", []),
-            # "items": history.get("items", []),
-            # "analysis": analysis_results,  # Pass AI-generated financial insights
-            "filters": {
-                "start_date": extracted_info.get("start_date", ""),
-                "end_date": extracted_info.get("end_date", ""),
-                "amount": extracted_info.get("amount", ""),
-                "math": extracted_info.get("math_operation", ""),
-                "movement_type": extracted_info.get("movement_type", ""),
-                "pfm_category": extracted_info.get("pfm-category", ""),
-                "movement_scope": extracted_info.get("movement_scope", ""),
-                "keywords": extracted_info.get("keywords", "")
-            },
-        "query_url_android": query_url_android,
-        "query_url_ios": query_url_ios
-        })
+        return jsonify(build_filters_response(extracted_info))
 @app.route('/upload_audio', methods=['POST'])
 def upload_audio():
-    """Receives uploaded audio file, saves it, and transcribes it."""
+    """Receives uploaded audio file and transcribes it straight from the request buffer."""
     if "audio" not in request.files:
         return jsonify({"error": "No audio file found"}), 400
 
     audio_file = request.files["audio"]
-    file_path = os.path.join(UPLOAD_FOLDER, "recorded_audio.wav")
-    audio_file.save(file_path)
 
     try:
-        transcription = transcribe(file_path)
+        # Trim silence, downmix and resample before the upload to Whisper
+        transcription = transcribe(*preprocess_upload(audio_file))
+        if transcription is None:
+            # transcribe logs the failure and returns None
+            raise RuntimeError("no transcription returned")
         extracted_info = extract_filters(transcription)
         extracted_info["User_Message"] = transcription
-        android_url = "lydia://advanced_search"
-        ios_url = "com.lydia-app.preprod://advanced_search"
 
-        query_url_android = create_advanced_search_url(android_url, extracted_info)
-        query_url_ios = create_advanced_search_url(ios_url, extracted_info)
-      
         # Return results with AI insights
-        return jsonify({
-            "clarification_needed": extracted_info.get("clarification_needed", []),
-            "clarification_options": extracted_info.get("clarification_options", []),
-            # "items": history.get("items", []),
-            # "analysis": analysis_results,  # Pass AI-generated financial insights
-            "filters": {
-                "start_date": extracted_info.get("start_date", ""),
-                "end_date": extracted_info.get("end_date", ""),
-                "amount": extracted_info.get("amount", ""),
-                "math": extracted_info.get("math_operation", ""),
-                "movement_type": extracted_info.get("movement_type", ""),
-                "pfm_category": extracted_info.get("pfm-category", ""),
-                "movement_scope": extracted_info.get("movement_scope", ""),
-                "keywords": extracted_info.get("keywords", "")
-            },
-        "query_url_android": query_url_android,
-        "query_url_ios": query_url_ios
-        })
+        return jsonify(build_filters_response(extracted_info))
     except Exception as e:
         return jsonify({"error": f"Error transcribing audio: {e}"}), 500
+
+
+@app.route('/process_text_stream', methods=['GET', 'POST'])
+def process_text_stream():
+    """Same as /process_text, but streams the filters then the analysis as server-sent events."""
+    user_text = request.values.get('user_text', '')
+    return Response(stream_with_context(text_events(user_text)), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/upload_audio_stream', methods=['POST'])
+def upload_audio_stream():
+    """Same as /upload_audio, but pushes the transcription as soon as it exists, then the filters and analysis."""
+    if "audio" not in request.files:
+        return jsonify({"error": "No audio file found"}), 400
+
+    # Werkzeug closes the request's files before a streamed body is read, so keep a copy
+    upload = request.files["audio"]
+    audio_file = FileStorage(io.BytesIO(upload.stream.read()), filename=upload.filename, content_type=upload.mimetype)
+
+    return Response(stream_with_context(audio_events(audio_file)), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch_route():
+    """Processes many utterances at once and streams the results back as NDJSON, in input order."""
+    utterances, concurrency, error = parse_batch_request(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    results = process_batch(utterances, concurrency)
+    return Response(stream_with_context(to_ndjson(result) for result in results), mimetype="application/x-ndjson")
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Exposes this worker's cache counters and OpenAI token usage."""
+    return jsonify({
+        "extract_filters_cache": filters_cache.stats(),
+        "transcription_cache": transcription_cache.stats(),
+        "history_cache": history_cache.stats(),
+        "rollup": rollup_stats(),
+        "openai_usage": usage_stats(),
+        "model_routing": routing_stats()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms, OpenAI tokens and cost, cache and error counters, in Prometheus format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,191 @@
+from quart import Quart, Response, render_template, request, jsonify
+from utils import build_filters_response, transcribe_async, filters_cache, transcription_cache, history_cache
+from usage import usage_stats
+from rollup import rollup_stats
+from routing import routing_stats
+from clients import close_async_clients
+from audio_processing import preprocess_upload
+from pipeline import run_pipeline, pipeline_stats
+from intent_classifier import intent_stats
+from batch import process_batch_async, parse_batch_request, to_ndjson
+from streaming import sse, analysis_events, iterate_in_thread, SSE_HEADERS
+from metrics import new_trace_id, current_trace_id, render_metrics
+import asyncio
+import os
+
+
+# Async serving mode: every route awaits OpenAI on one shared, pooled AsyncOpenAI client,
+# so a single process can hold hundreds of in-flight queries. Run with
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+app = Quart(__name__)
+# Uploads larger than this are rejected with a 413 while the body is streamed in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+
+@app.errorhandler(413)
+async def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds the {MAX_UPLOAD_BYTES} bytes limit"}), 413
+
+
+@app.after_serving
+async def shutdown():
+    await close_async_clients()
+
+
+@app.before_request
+async def start_trace():
+    new_trace_id(request.headers.get("X-Trace-Id"))
+
+
+@app.after_request
+async def echo_trace(response):
+    """Echoes the request's trace ID in a header and in JSON bodies."""
+    trace_id = current_trace_id()
+    if trace_id:
+        response.headers["X-Trace-Id"] = trace_id
+        if response.mimetype == "application/json":
+            body = await response.get_json(silent=True)
+            if isinstance(body, dict):
+                body["trace_id"] = trace_id
+                response.set_data(app.json.dumps(body))
+    return response
+
+
+async def filters_response(is_transaction, extracted_info):
+    # Answering a math_operation may search the history API, off the event loop
+    response = await asyncio.to_thread(build_filters_response, extracted_info)
+    if not is_transaction:
+        response["off_topic"] = True
+    return response
+
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+
+@app.route('/process_text', methods=['POST'])
+async def process_text():
+    form = await request.form
+    user_text = form['user_text']
+    try:
+        is_transaction, extracted_info = await run_pipeline(user_text)
+    except asyncio.TimeoutError:
+        return jsonify({"error": "Filter extraction timed out"}), 504
+    extracted_info["User_Message"] = user_text
+    print(extracted_info)
+    return jsonify(await filters_response(is_transaction, extracted_info))
+
+
+@app.route('/upload_audio', methods=['POST'])
+async def upload_audio():
+    """Receives uploaded audio file and transcribes it straight from the request buffer."""
+    files = await request.files
+    if "audio" not in files:
+        return jsonify({"error": "No audio file found"}), 400
+
+    audio_file = files["audio"]
+
+    try:
+        # Preprocessing is CPU-bound (and may shell out to ffmpeg), so keep it off the event loop
+        audio, cache_key = await asyncio.to_thread(preprocess_upload, audio_file)
+        transcription = await transcribe_async(audio, cache_key)
+        if transcription is None:
+            # transcribe_async logs the failure and returns None
+            raise RuntimeError("no transcription returned")
+        is_transaction, extracted_info = await run_pipeline(transcription)
+        extracted_info["User_Message"] = transcription
+        return jsonify(await filters_response(is_transaction, extracted_info))
+    except Exception as e:
+        return jsonify({"error": f"Error transcribing audio: {e}"}), 500
+
+
+async def text_stream(user_text):
+    try:
+        is_transaction, extracted_info = await run_pipeline(user_text)
+        extracted_info["User_Message"] = user_text
+        filters = await filters_response(is_transaction, extracted_info)
+    except asyncio.TimeoutError:
+        yield sse("error", {"stage": "filters", "error": "Filter extraction timed out"})
+        return
+    except Exception as e:
+        yield sse("error", {"stage": "filters", "error": str(e)})
+        return
+    yield sse("filters", filters)
+    if is_transaction:
+        async for event in iterate_in_thread(analysis_events(extracted_info)):
+            yield event
+    yield sse("done", {})
+
+
+@app.route('/process_text_stream', methods=['GET', 'POST'])
+async def process_text_stream():
+    """Same as /process_text, but streams the filters then the analysis as server-sent events."""
+    values = await request.values
+    return Response(text_stream(values.get('user_text', '')), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/upload_audio_stream', methods=['POST'])
+async def upload_audio_stream():
+    """Same as /upload_audio, but pushes the transcription as soon as it exists, then the filters and analysis."""
+    files = await request.files
+    if "audio" not in files:
+        return jsonify({"error": "No audio file found"}), 400
+
+    audio_file = files["audio"]
+
+    async def stream():
+        try:
+            audio, cache_key = await asyncio.to_thread(preprocess_upload, audio_file)
+            transcription = await transcribe_async(audio, cache_key)
+            if transcription is None:
+                # transcribe_async logs the failure and returns None
+                raise RuntimeError("no transcription returned")
+        except Exception as e:
+            yield sse("error", {"stage": "transcription", "error": f"Error transcribing audio: {e}"})
+            return
+        yield sse("transcription", {"text": transcription})
+        async for event in text_stream(transcription):
+            yield event
+
+    return Response(stream(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/process_batch', methods=['POST'])
+async def process_batch_route():
+    """Processes many utterances at once and streams the results back as NDJSON, in input order."""
+    utterances, concurrency, error = parse_batch_request(await request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    async def stream():
+        async for result in process_batch_async(utterances, concurrency):
+            yield to_ndjson(result)
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    """Exposes this worker's cache counters and OpenAI token usage."""
+    return jsonify({
+        "extract_filters_cache": filters_cache.stats(),
+        "transcription_cache": transcription_cache.stats(),
+        "history_cache": history_cache.stats(),
+        "rollup": rollup_stats(),
+        "openai_usage": usage_stats(),
+        "model_routing": routing_stats(),
+        "pipeline": pipeline_stats(),
+        "intent_classifier": intent_stats()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Per-stage latency histograms, OpenAI tokens and cost, cache and error counters, in Prometheus format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import time
+import wave
+
+from cache import make_key
+from metrics import stage_timer
+
+
+TARGET_SAMPLE_RATE = 16000
+# Set to 0 to forward uploads to Whisper untouched
+AUDIO_PREPROCESSING = os.getenv("AUDIO_PREPROCESSING", "1") == "1"
+# Optional compact codec for the Whisper upload, e.g. "opus" or "mp3" (needs ffmpeg). Empty keeps 16-bit WAV.
+AUDIO_ENCODE_CODEC = os.getenv("AUDIO_ENCODE_CODEC", "")
+# Frames quieter than this fraction of the loudest frame (and this absolute floor) count as silence
+VAD_RELATIVE_THRESHOLD = float(os.getenv("AUDIO_VAD_RELATIVE_THRESHOLD", "0.05"))
+VAD_MIN_RMS = float(os.getenv("AUDIO_VAD_MIN_RMS", "0.005"))
+VAD_FRAME_SECONDS = 0.02
+VAD_PADDING_SECONDS = 0.2
+
+FFMPEG = shutil.which("ffmpeg")
+# ffmpeg is killed after this many seconds; preprocess_upload then sends the raw upload
+FFMPEG_TIMEOUT = float(os.getenv("AUDIO_FFMPEG_TIMEOUT", "10"))
+
+CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"], "ogg", "audio/ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"], "mp3", "audio/mpeg"),
+    "flac": (["-c:a", "flac", "-f", "flac"], "flac", "audio/flac"),
+}
+
+
+def _decode_wav(data):
+    """
+    Decodes PCM WAV bytes into (mono float32 samples in [-1, 1], sample rate).
+    """
+    import numpy as np
+
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width}")
+
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def _decode_ffmpeg(data):
+    """
+    Decodes any container ffmpeg understands (MediaRecorder webm/ogg, m4a...) straight
+    to mono 16 kHz float samples.
+    """
+    import numpy as np
+
+    result = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True, check=True, timeout=FFMPEG_TIMEOUT,
+    )
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768, TARGET_SAMPLE_RATE
+
+
+def resample(samples, sample_rate, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Resamples mono samples to target_rate. Integer ratios are box-filtered before
+    decimation; anything else falls back to linear interpolation.
+    """
+    import numpy as np
+
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+    if sample_rate % target_rate == 0:
+        factor = sample_rate // target_rate
+        usable = len(samples) - len(samples) % factor
+        return samples[:usable].reshape(-1, factor).mean(axis=1)
+    duration = len(samples) / sample_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.linspace(0, len(samples) - 1, num=target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def trim_silence(samples, sample_rate):
+    """
+    Energy-based VAD: drops leading and trailing frames whose RMS stays under the
+    silence threshold, keeping a little padding around the speech.
+    """
+    import numpy as np
+
+    frame = max(1, int(sample_rate * VAD_FRAME_SECONDS))
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[: frame_count * frame].reshape(frame_count, frame) ** 2, axis=1))
+    threshold = max(VAD_MIN_RMS, float(rms.max()) * VAD_RELATIVE_THRESHOLD)
+    voiced = np.flatnonzero(rms >= threshold)
+    if len(voiced) == 0:
+        return samples
+
+    padding = int(sample_rate * VAD_PADDING_SECONDS)
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def _encode_wav(samples, sample_rate):
+    import numpy as np
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _encode_codec(wav_bytes, codec):
+    args, extension, content_type = CODECS[codec]
+    result = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0", *args, "pipe:1"],
+        input=wav_bytes, capture_output=True, check=True, timeout=FFMPEG_TIMEOUT,
+    )
+    return result.stdout, extension, content_type
+
+
+def preprocess_audio(data, filename="recorded_audio.wav", content_type="audio/wav"):
+    """
+    Trims silence, downmixes to mono, resamples to 16 kHz and optionally compresses an
+    uploaded clip before it goes to Whisper.
+    Returns the (name, stream, type) file tuple accepted by the OpenAI client. Audio
+    that can't be decoded here is returned unchanged.
+    """
+    started = time.perf_counter()
+    bytes_in = len(data)
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        samples, sample_rate = _decode_wav(data)
+    elif FFMPEG:
+        samples, sample_rate = _decode_ffmpeg(data)
+    else:
+        print(f"🎚️ Audio not preprocessed ({content_type}, no ffmpeg): {bytes_in} bytes")
+        return filename, io.BytesIO(data), content_type
+
+    samples = resample(samples, sample_rate)
+    duration_in = len(samples) / TARGET_SAMPLE_RATE
+    samples = trim_silence(samples, TARGET_SAMPLE_RATE)
+    duration_out = len(samples) / TARGET_SAMPLE_RATE
+
+    output = _encode_wav(samples, TARGET_SAMPLE_RATE)
+    base_name = os.path.splitext(filename or "recorded_audio")[0]
+    name, output_type = f"{base_name}.wav", "audio/wav"
+    if AUDIO_ENCODE_CODEC in CODECS and FFMPEG:
+        output, extension, output_type = _encode_codec(output, AUDIO_ENCODE_CODEC)
+        name = f"{base_name}.{extension}"
+
+    print(
+        f"🎚️ Audio preprocessed: {bytes_in} → {len(output)} bytes, "
+        f"trimmed {duration_in - duration_out:.2f}s of {duration_in:.2f}s "
+        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return name, io.BytesIO(output), output_type
+
+
+def upload_cache_key(data):
+    """
+    Returns the transcription cache key of an upload: a hash of the original bytes and of
+    the preprocessing settings. The encoded output can't be hashed instead, since Ogg/Opus
+    writes a random stream serial into every encode.
+    """
+    settings = [TARGET_SAMPLE_RATE, AUDIO_ENCODE_CODEC if FFMPEG else "", VAD_RELATIVE_THRESHOLD,
+                VAD_MIN_RMS, VAD_FRAME_SECONDS, VAD_PADDING_SECONDS, bool(FFMPEG)]
+    return make_key("preprocessed", hashlib.sha256(data).hexdigest(), settings)
+
+
+def preprocess_upload(audio_file):
+    """
+    Runs preprocess_audio on an uploaded FileStorage, falling back to the raw upload
+    when preprocessing is disabled or fails.
+    Returns (file tuple, transcription cache key). The key is None when the file sent is
+    the upload itself, which transcribe then hashes directly.
+    """
+    audio_file.stream.seek(0)
+    if not AUDIO_PREPROCESSING:
+        return (audio_file.filename or "recorded_audio.wav", audio_file.stream, audio_file.mimetype or "audio/wav"), None
+
+    with stage_timer("upload_read"):
+        data = audio_file.stream.read()
+    try:
+        with stage_timer("audio_preprocessing"):
+            file = preprocess_audio(data, audio_file.filename or "recorded_audio.wav", audio_file.mimetype or "audio/wav")
+        return file, upload_cache_key(data)
+    except Exception as e:
+        print(f"❌ Error preprocessing audio: {e}")
+        return (audio_file.filename or "recorded_audio.wav", io.BytesIO(data), audio_file.mimetype or "audio/wav"), None
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalize_text
+from utils import extract_filters, extract_filters_async, build_filters_response
+
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "64"))
+BATCH_MAX_UTTERANCES = int(os.getenv("BATCH_MAX_UTTERANCES", "10000"))
+# Retries on 429s on top of the OpenAI client's own, with exponential backoff
+BATCH_RATE_LIMIT_RETRIES = int(os.getenv("BATCH_RATE_LIMIT_RETRIES", "4"))
+
+
+def _concurrency(concurrency):
+    return max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+
+def _dedupe(utterances):
+    """
+    Maps every utterance to the index of its first normalized occurrence.
+    Returns (unique utterances, index into them for each input).
+    """
+    unique, positions, seen = [], [], {}
+    for utterance in utterances:
+        key = normalize_text(utterance)
+        if key not in seen:
+            seen[key] = len(unique)
+            unique.append(utterance)
+        positions.append(seen[key])
+    return unique, positions
+
+
+def _result(index, utterance, response):
+    return {"index": index, "user_text": utterance, **response}
+
+
+def _process_one(utterance):
+    # Resolved before the handler, so a failing import never replaces the original error
+    from openai import RateLimitError
+
+    for attempt in range(BATCH_RATE_LIMIT_RETRIES + 1):
+        try:
+            # Batches never search the history API for math answers
+            return build_filters_response(extract_filters(utterance), answer_math=False)
+        except RateLimitError:
+            if attempt == BATCH_RATE_LIMIT_RETRIES:
+                return {"error": "Rate limited"}
+            time.sleep(2 ** attempt)
+        except Exception as e:
+            return {"error": str(e)}
+
+
+async def _process_one_async(utterance, semaphore):
+    from openai import RateLimitError
+
+    async with semaphore:
+        for attempt in range(BATCH_RATE_LIMIT_RETRIES + 1):
+            try:
+                return build_filters_response(await extract_filters_async(utterance), answer_math=False)
+            except RateLimitError:
+                if attempt == BATCH_RATE_LIMIT_RETRIES:
+                    return {"error": "Rate limited"}
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                return {"error": str(e)}
+
+
+def process_batch(utterances, concurrency=None):
+    """
+    Runs extract_filters + the deep links over many utterances, with at most
+    `concurrency` LLM calls in flight. Identical utterances are only processed once.
+    Yields one result per input, in input order, as soon as it (and all before it) are done.
+    """
+    unique, positions = _dedupe(utterances)
+    executor = ThreadPoolExecutor(max_workers=_concurrency(concurrency))
+    try:
+        futures = [executor.submit(_process_one, utterance) for utterance in unique]
+        for index, (utterance, position) in enumerate(zip(utterances, positions)):
+            yield _result(index, utterance, futures[position].result())
+    finally:
+        # Drop queued work if the consumer stops early (e.g. the client disconnected)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def process_batch_async(utterances, concurrency=None):
+    """
+    Async counterpart of process_batch, on the shared async OpenAI client.
+    """
+    unique, positions = _dedupe(utterances)
+    semaphore = asyncio.Semaphore(_concurrency(concurrency))
+    tasks = [asyncio.create_task(_process_one_async(utterance, semaphore)) for utterance in unique]
+    try:
+        for index, (utterance, position) in enumerate(zip(utterances, positions)):
+            yield _result(index, utterance, await tasks[position])
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def parse_batch_request(body):
+    """
+    Validates a /process_batch JSON body. Returns (utterances, concurrency, error).
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("utterances"), list):
+        return None, None, 'Expected a JSON body like {"utterances": ["..."], "concurrency": 8}'
+    utterances = [str(utterance) for utterance in body["utterances"]]
+    if len(utterances) > BATCH_MAX_UTTERANCES:
+        return None, None, f"At most {BATCH_MAX_UTTERANCES} utterances per batch"
+    concurrency = body.get("concurrency")
+    if concurrency is not None and (type(concurrency) is not int or concurrency < 1):
+        return None, None, '"concurrency" must be a positive integer'
+    return utterances, concurrency, None
+
+
+def to_ndjson(result):
+    return json.dumps(result, ensure_ascii=False) + "\n"
+
+
+if __name__ == "__main__":
+    # Replays a log of utterances, one per line, and writes NDJSON results to stdout:
+    #   python batch.py queries.txt [concurrency] > results.ndjson
+    with open(sys.argv[1], encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    for result in process_batch(lines, int(sys.argv[2]) if len(sys.argv) > 2 else None):
+        sys.stdout.write(to_ndjson(result))
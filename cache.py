@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+
+
+CACHE_DB_PATH = os.getenv("SPENDBOT_CACHE_DB", os.path.join("cache", "spendbot_cache.sqlite3"))
+
+
+def normalize_text(text):
+    """
+    Normalizes a user utterance so trivially different phrasings share a cache entry.
+    Lowercases, unifies apostrophes and collapses whitespace and trailing punctuation.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = text.lower().replace("’", "'").replace("`", "'")
+    text = " ".join(text.split())
+    return text.strip(" ?!.")
+
+
+def make_key(*parts):
+    """
+    Builds a stable cache key from any JSON-serializable parts.
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache: an in-process LRU with TTL in front of a SQLite table shared by
+    every gunicorn worker on the dyno. Values must be JSON-serializable.
+    """
+
+    # Every live cache, so /metrics can report their counters
+    instances = weakref.WeakSet()
+
+    def __init__(self, namespace, max_entries=1024, ttl=3600, disk_ttl=None,
+                 disk_max_entries=50000, db_path=CACHE_DB_PATH):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl if disk_ttl is not None else ttl
+        self.disk_max_entries = disk_max_entries
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._writes = 0
+        self.stats_counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "disk_errors": 0,
+        }
+        ResultCache.instances.add(self)
+
+    # --- SQLite tier -------------------------------------------------------
+    def _db(self):
+        # Connections must not be shared across fork(), so reopen in each worker.
+        if self.db_path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (namespace, expires_at)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _disk_get(self, key, now):
+        try:
+            db = self._db()
+            if db is None:
+                return None, None
+            row = db.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.stats_counters["disk_errors"] += 1
+            print(f"❌ Cache read failed ({self.namespace}): {e}")
+            return None, None
+        if row is None:
+            return None, None
+        if row[1] <= now:
+            self.stats_counters["expirations"] += 1
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key, value, expires_at):
+        try:
+            db = self._db()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            self._writes += 1
+            # Prune expired and overflowing rows every so often rather than on each write.
+            if self._writes % 100 == 0:
+                self._disk_prune(db)
+            db.commit()
+        except sqlite3.Error as e:
+            self.stats_counters["disk_errors"] += 1
+            print(f"❌ Cache write failed ({self.namespace}): {e}")
+
+    def _disk_prune(self, db):
+        deleted = db.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time()),
+        ).rowcount
+        deleted += db.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ?"
+            " ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.disk_max_entries),
+        ).rowcount
+        self.stats_counters["evictions"] += max(deleted, 0)
+
+    # --- Public API ----------------------------------------------------------
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats_counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self.stats_counters["expirations"] += 1
+
+            value, expires_at = self._disk_get(key, now)
+            if value is None:
+                self.stats_counters["misses"] += 1
+                return None
+            self.stats_counters["disk_hits"] += 1
+            self._memory_set(key, value, min(expires_at, now + self.ttl))
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores value under key in both tiers. ttl overrides the default for this entry.
+        """
+        now = time.time()
+        memory_ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        disk_ttl = self.disk_ttl if ttl is None else ttl
+        with self._lock:
+            self._memory_set(key, value, now + memory_ttl)
+            if disk_ttl > 0:
+                self._disk_set(key, value, now + disk_ttl)
+
+    def _memory_set(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats_counters["evictions"] += 1
+
+    def invalidate(self, key):
+        """
+        Drops key from both tiers.
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                    db.commit()
+            except sqlite3.Error as e:
+                self.stats_counters["disk_errors"] += 1
+                print(f"❌ Cache invalidation failed ({self.namespace}): {e}")
+
+    def clear(self):
+        """
+        Drops every entry of this namespace from both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                    db.commit()
+            except sqlite3.Error as e:
+                self.stats_counters["disk_errors"] += 1
+                print(f"❌ Cache clear failed ({self.namespace}): {e}")
+
+    def stats(self):
+        """
+        Returns hit/miss/eviction counters for this worker, plus the current sizes.
+        """
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats["memory_entries"] = len(self._memory)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,93 @@
+import math
+import os
+import threading
+
+from constants import PFM_CATEGORY_DESCRIPTIONS
+from intent_classifier import featurize
+
+
+# Number of candidate categories sent to the LLM; 0 keeps the full list in the static prompt
+PFM_CATEGORY_TOP_K = int(os.getenv("PFM_CATEGORY_TOP_K", "0"))
+
+
+class CategoryIndex:
+    """
+    TF-IDF vectors over word and character n-grams of each category's name, description and
+    synonyms, stored as one dense NumPy matrix so a query is scored with a single product.
+    """
+
+    def __init__(self, descriptions):
+        import numpy as np
+
+        self.categories = list(descriptions)
+        documents = [featurize(f"{name.replace('_', ' ')} {text}") for name, text in descriptions.items()]
+
+        self.vocabulary = {}
+        for document in documents:
+            for feature in document:
+                self.vocabulary.setdefault(feature, len(self.vocabulary))
+
+        matrix = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for feature, value in document.items():
+                matrix[row, self.vocabulary[feature]] = value
+
+        document_frequency = (matrix > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix *= self.idf
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix
+
+    def scores(self, text):
+        """
+        Returns the cosine similarity of text to every category, in self.categories order.
+        """
+        import numpy as np
+
+        columns, values = [], []
+        for feature, value in featurize(text).items():
+            column = self.vocabulary.get(feature)
+            if column is not None:
+                columns.append(column)
+                values.append(value * self.idf[column])
+        if not columns:
+            return np.zeros(len(self.categories), dtype=np.float32)
+        values = np.asarray(values, dtype=np.float32)
+        return self.matrix[:, columns] @ (values / math.sqrt(float(values @ values)))
+
+    def search(self, text, k):
+        """
+        Returns up to k categories most similar to text, best first.
+        """
+        import numpy as np
+
+        k = min(k, len(self.categories))
+        if k <= 0:
+            return []
+        scores = self.scores(text)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.categories[i] for i in top if scores[i] > 0]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_category_index():
+    """
+    Builds the index on first use. preload.warm_up() builds it in the gunicorn master so
+    forked workers share it.
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = CategoryIndex(PFM_CATEGORY_DESCRIPTIONS)
+        return _index
+
+
+def top_k_categories(text, k=None):
+    """
+    Returns the k candidate PFM categories for an utterance.
+    """
+    return get_category_index().search(text, k or PFM_CATEGORY_TOP_K)
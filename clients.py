@@ -0,0 +1,102 @@
+import asyncio
+import os
+import threading
+import weakref
+
+
+# Connection pool and concurrency settings for the OpenAI clients, per process
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "256"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_sync_client = None
+# An async client and its pool are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=30,
+    )
+
+
+def openai_module():
+    """
+    Imports the OpenAI SDK on first use, so importing the app does not pay for it.
+    Raises ValueError if OPENAI_API_KEY is not set.
+    """
+    import openai
+
+    if openai.api_key is None:
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        if openai.api_key is None:
+            raise ValueError("❌ OPENAI_API_KEY is not set. Make sure to add it to Heroku.")
+    return openai
+
+
+def get_openai_client():
+    """
+    Returns the process-wide synchronous OpenAI client.
+    """
+    import httpx
+
+    openai = openai_module()
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.Client(limits=_limits(), timeout=OPENAI_TIMEOUT),
+            )
+        return _sync_client
+
+
+def get_async_openai_client():
+    """
+    Returns the AsyncOpenAI client shared by every request on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import httpx
+
+        client = openai_module().AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=OPENAI_TIMEOUT),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def openai_slot():
+    """
+    Returns the semaphore bounding in-flight OpenAI calls on the running event loop.
+    Use as `async with openai_slot(): ...`.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def close_async_clients():
+    """
+    Closes the async client of the running loop, on server shutdown.
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -39,4 +39,101 @@ PFM_CATEGORIES = [
     "trading", "travel_accomodation", "travelling_platforms", "travel_means",
     "uncategorizable", "vpns", "transportation", "online_content", "groceries",
     "restaurants_bars_cafes"
-]
\ No newline at end of file
+]
+
+# French/English descriptions and synonyms for each PFM category, used to retrieve the
+# few categories relevant to a query instead of sending the whole list to the LLM.
+PFM_CATEGORY_DESCRIPTIONS = {
+    "atm": "retrait distributeur DAB espèces liquide cash withdrawal ATM",
+    "auto_insurance": "assurance auto voiture moto car insurance MAAF MACIF",
+    "bakeries": "boulangerie pâtisserie pain croissant viennoiserie bakery Paul Brioche Dorée",
+    "neutral_for_information": "opération neutre information interne neutral information",
+    "benefits": "allocations CAF aides sociales prestations chômage Pôle emploi France Travail benefits welfare",
+    "betting": "paris sportifs pari PMU FDJ loto Winamax Betclic Unibet casino jeux d'argent betting gambling",
+    "bio_markets": "magasin bio Biocoop Naturalia La Vie Claire organic market",
+    "cafes_bars": "café bar bistrot brasserie PMU apéro verre bière soirée pub coffee shop Starbucks",
+    "car_rental": "location voiture Hertz Europcar Sixt Getaround car rental",
+    "car_wash_repair": "garage garagiste réparation entretien lavage voiture Norauto Midas Speedy car wash repair mechanic",
+    "children_care": "crèche nounou garde d'enfants baby-sitting childcare babysitter",
+    "clothing": "vêtements habits chaussures mode fringues Zara H&M Uniqlo Kiabi clothes shoes fashion",
+    "commodities": "charges énergie électricité gaz eau EDF Engie facture utilities",
+    "commuting": "transport quotidien trajet navigo RATP SNCF TER métro bus abonnement commute",
+    "credit_conso": "crédit consommation prêt conso Cofidis Cetelem Sofinco consumer credit",
+    "cosmetics": "cosmétiques maquillage parfum beauté Sephora Nocibé Yves Rocher makeup beauty",
+    "opera_theatre_concerts_standup_museum_cinema": "cinéma théâtre opéra concert spectacle musée expo stand-up UGC Pathé Fnac billetterie cinema theatre museum show",
+    "dating": "site de rencontre Tinder Meetic Bumble Hinge dating app",
+    "debt_collection": "recouvrement créance huissier dette debt collection",
+    "diy": "bricolage outillage perceuse Leroy Merlin Castorama Brico Dépôt DIY hardware",
+    "education_degrees": "école université frais de scolarité inscription études diplôme tuition school",
+    "electronics_it_stores": "électronique informatique high-tech ordinateur téléphone Fnac Darty Boulanger Apple Store electronics",
+    "entertainment": "loisirs divertissement sortie parc d'attractions bowling escape game entertainment leisure",
+    "fintechs": "fintech néobanque Revolut N26 PayPal Lydia Sumeria wallet",
+    "fintechs_suspicious": "fintech suspecte crypto plateforme douteuse suspicious fintech",
+    "food_delivery": "livraison repas Uber Eats Deliveroo Just Eat commande à domicile food delivery takeaway",
+    "food_retail": "épicerie alimentation commerce alimentaire primeur boucherie food retail",
+    "18_plus": "adulte contenu pour adultes sex shop adult content",
+    "furniture": "meubles ameublement décoration IKEA Conforama Maisons du Monde furniture",
+    "gaming": "jeux vidéo console PlayStation Xbox Nintendo Steam gaming video games",
+    "gifts": "cadeaux cadeau anniversaire Noël gifts presents",
+    "give": "dons association charité don donation charity",
+    "hairdresser": "coiffeur coiffure barbier salon hairdresser barber haircut",
+    "hard_bank_fees": "frais bancaires agios commission intervention incident bank fees overdraft",
+    "hardest_bank_fees": "frais bancaires rejet prélèvement impayé pénalité bank penalty",
+    "health_insurance": "mutuelle complémentaire santé assurance santé health insurance",
+    "insurance": "assurance habitation assurance vie prévoyance AXA Allianz insurance",
+    "internal": "virement interne entre mes comptes internal transfer own accounts",
+    "jewelry": "bijoux bijouterie montre joaillerie jewelry watches",
+    "laundromat_pressing": "laverie pressing blanchisserie laundromat dry cleaning",
+    "leasing": "leasing location longue durée LOA LLD",
+    "legal_finance": "avocat notaire comptable juridique frais légaux lawyer notary accountant",
+    "loans": "prêt emprunt crédit immobilier remboursement de prêt mensualité loan mortgage",
+    "marketplace": "marketplace Leboncoin Vinted eBay Amazon Cdiscount achat en ligne online shopping",
+    "medical": "médecin docteur dentiste hôpital clinique consultation kiné soins doctor medical",
+    "misc": "divers autres dépenses diverses miscellaneous",
+    "multimedia": "multimédia livres musique CD DVD Fnac culture media",
+    "newspapers_magasines": "journal presse magazine abonnement actualités Le Monde newspaper magazine",
+    "new_means_of_transportation": "trottinette vélo électrique Lime Dott Vélib scooter partagé e-scooter bike sharing",
+    "online_courses": "cours en ligne formation Udemy Coursera OpenClassrooms online course",
+    "optical_hearing": "opticien lunettes lentilles audition Afflelou Krys Optic 2000 glasses optician",
+    "other_income": "autres revenus entrées diverses revenu exceptionnel other income",
+    "other_passive_activities": "revenus passifs loyers perçus dividendes passive income",
+    "others_housing": "logement charges copropriété syndic entretien maison housing",
+    "parking": "parking stationnement horodateur Indigo parking fee",
+    "pet_stuff": "animaux vétérinaire croquettes animalerie chien chat pet vet",
+    "pharmacies": "pharmacie médicaments parapharmacie pharmacy drugstore",
+    "phone_internet_plan": "forfait téléphone mobile internet box Orange SFR Free Bouygues phone plan",
+    "photography_art": "photographie photo art galerie matériel artistique photography art",
+    "playful_culture": "culture ludique jeux de société jouets loisirs créatifs toys board games",
+    "prepaid_cards": "carte prépayée recharge Transcash PCS prepaid card",
+    "professional_expenses": "frais professionnels notes de frais dépenses pro business expenses",
+    "refund": "remboursement remboursé avoir rétrocession refund reimbursement",
+    "rent": "loyer location appartement propriétaire proprio bailleur rent landlord",
+    "restaurants": "restaurant resto déjeuner dîner McDonald's McDo Burger King KFC fast-food pizzeria nourriture food dining",
+    "retro_bank_fees": "rétrocession frais bancaires remboursement frais fee refund",
+    "salary_revenues": "salaire paie paye employeur revenus du travail salary payroll wages",
+    "savings_investments": "épargne placement livret A assurance vie PEA investissement savings investment",
+    "security": "sécurité alarme télésurveillance Verisure security alarm",
+    "self_care": "bien-être spa massage manucure esthéticienne self care wellness",
+    "mailing_printing_delivery": "poste courrier colis envoi impression La Poste Colissimo mailing printing parcel",
+    "shopping_center": "centre commercial grand magasin Galeries Lafayette Printemps shopping mall department store",
+    "snacking": "snack en-cas boulangerie sandwich distributeur fast food snacking",
+    "soft_bank_fees": "frais bancaires cotisation carte tenue de compte card fee account fee",
+    "software": "logiciel abonnement SaaS Microsoft Adobe Google One iCloud software subscription",
+    "sports_activities": "sport salle de sport club fitness Basic Fit piscine gym sports club",
+    "sports_equipment": "équipement sportif Decathlon Décat Go Sport Intersport sports equipment",
+    "supermarkets": "supermarché courses hypermarché Carrefour Leclerc Auchan Lidl Intermarché Monoprix Franprix supermarket groceries",
+    "tabac_presse": "tabac presse bureau de tabac cigarettes journaux tobacco newsagent",
+    "taxes": "impôts taxe foncière taxe d'habitation impôt sur le revenu amendes DGFiP taxes",
+    "taxis": "taxi VTC Uber Bolt Heetch G7 cab ride",
+    "tolls_gas_stations": "essence carburant station-service péage autoroute Total Shell Esso gas tolls fuel",
+    "trading": "bourse trading actions crypto Boursorama Trade Republic Binance stocks",
+    "travel_accomodation": "hôtel hébergement Airbnb Booking location vacances voyage hotel accommodation",
+    "travelling_platforms": "plateforme de voyage Booking Expedia Opodo agence de voyage travel agency",
+    "travel_means": "billet de train avion vol SNCF Air France easyJet Ryanair OuiGo train plane flight",
+    "uncategorizable": "non catégorisable inconnu autre uncategorized unknown",
+    "vpns": "VPN NordVPN ExpressVPN Surfshark privacy",
+    "transportation": "transport déplacement mobilité transports en commun transportation",
+    "online_content": "contenu en ligne streaming Netflix Spotify Disney+ Deezer YouTube Premium Amazon Prime abonnement streaming",
+    "groceries": "courses alimentaires épicerie provisions groceries",
+    "restaurants_bars_cafes": "restaurants bars cafés sorties restaurant bar café dining out",
+}
@@ -1,9 +1,17 @@
-import openai
 import json
 from datetime import datetime
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import numpy as np
+import pandas as pd
+
+from transaction_frame import build_transaction_frame
+from usage import record_usage
+from metrics import stage_timer
+from clients import get_openai_client
+from routing import completion_problem, model_tiers, record, route
 
 
 response_format = {
@@ -72,45 +80,319 @@ response_format = {
 #     transaction_data = json.load(file)
 
 
-# Example function to analyze transactions using OpenAI
-def analyze_transactions_with_openai(transaction_data):
+# Relative change of the fitted daily spending over the window below which the trend is "stable"
+TREND_STABLE_THRESHOLD = float(os.getenv("TREND_STABLE_THRESHOLD", "0.1"))
+TOP_GROUPS = 3
 
-    prompt = f"""
-    You are an AI financial analyst. Analyze the provided transaction data and extract only the **most important financial insights** in a **concise and factual manner**.
-    {transaction_data}
-
-    ### Analyses to Perform:
-    - Group transactions by category, merchant, or location if multiple values exist.
-    - Analyze and summarize the results.
-    - Identify the highest transaction amount overall or within a specific group/category if available.
-    - Calculate the average transaction amount overall or within a specific group/category if available. Provide ifo about the selected group/category eg per day week etc
-    - Analyze spending trends over time to identify patterns such as increasing or decreasing spending.
-    - Identify any seasonal trends or changes during holidays.
-    - Avoid unnecessary explanations or reflections—only state the facts.
-    - Keep sentences short and direct.
-    - **State only the key facts** about the transactions.
-    - **Do not include interpretations or assumptions.** 
-    - Report **only measurable insights** (e.g., total spending, highest transaction, frequency).
-    - If an insight lacks a trend or pattern, **omit it.**
-    - Be **clear and specific**—for example, clarify what "average" is based on.
 
-    - Present top 3 highlights (3 points as a one liner) as a **brief structured summary**.
-    - Use your imagination to create a **concise and informative** response.
-    - **No unnecessary descriptions, reflections, or trends unless critical.**
-    - **Strictly state the key numbers and facts.**
-    Ensure the response is **short, precise, and strictly factual.** Omit insights that are **not significant.**
-    Do not include things Headings like Summary of Key Insights, or any other unnecessary information. 
-    
+def transactions_frame(transaction_data):
+    """
+    Returns the (date, amount, category, title) frame of a history response, any
+    iterable of transactions such as utils.iter_history(filters), or a frame already
+    built by transaction_frame.build_transaction_frame.
+    """
+    if isinstance(transaction_data, pd.DataFrame):
+        frame = transaction_data
+    else:
+        frame = build_transaction_frame(transaction_data, columns=["date", "amount", "category", "title"])
+    return frame.dropna(subset=["date", "amount"])
+
+
+def _spending(frame):
+    """
+    Outgoing amounts as positive numbers. When the items carry no sign (every amount is
+    positive), they are all taken as spending.
+    """
+    amounts = frame["amount"].to_numpy(dtype=float)
+    if (amounts < 0).any():
+        return frame.assign(spent=-amounts)[amounts < 0]
+    return frame.assign(spent=np.abs(amounts))
+
+
+def _window(frame, start_date, end_date):
+    start = pd.Timestamp(start_date) if start_date else frame["date"].min().tz_localize(None).normalize()
+    end = pd.Timestamp(end_date) if end_date else frame["date"].max().tz_localize(None).normalize()
+    return start, max(end, start)
+
+
+def _frequency_unit(days):
+    if days <= 14:
+        return "D", "%Y-%m-%d"
+    if days <= 92:
+        return "W", "%G-W%V"
+    return "M", "%Y-%m"
+
+
+def _trend(daily):
+    """
+    Least-squares slope of the daily totals, and its label from the change it implies
+    over the whole window relative to the mean day.
+    """
+    if len(daily) < 2 or not daily.any():
+        return 0.0, "stable"
+    slope = float(np.polyfit(np.arange(len(daily), dtype=float), daily, 1)[0])
+    relative_change = slope * (len(daily) - 1) / daily.mean()
+    if relative_change > TREND_STABLE_THRESHOLD:
+        return slope, "increasing"
+    if relative_change < -TREND_STABLE_THRESHOLD:
+        return slope, "decreasing"
+    return slope, "stable"
+
+
+def _top(spent, column):
+    totals = spent.dropna(subset=[column]).groupby(column)["spent"].sum().nlargest(TOP_GROUPS)
+    return {name: round(float(total), 2) for name, total in totals.items()}
+
+
+def compute_spending_metrics(transaction_data, start_date=None, end_date=None):
+    """
+    Computes the response_format fields locally with vectorized pandas/NumPy, plus the
+    trend slope, the largest transaction and the top categories and merchants.
+    The analysis window defaults to the span of the transactions; the current and
+    previous periods are its second and first halves.
+    """
+    spent = _spending(transactions_frame(transaction_data))
+    if not spent.empty:
+        start, end = _window(spent, start_date, end_date)
+        dates = spent["date"].dt.tz_localize(None).dt.normalize()
+        in_window = ((dates >= start) & (dates <= end)).to_numpy()
+        spent, dates = spent[in_window], dates[in_window]
+    if spent.empty:
+        return {
+            "transaction_count": 0,
+            "total_spending": 0.0,
+            "average_spending": {},
+            "frequency": {},
+            "peak_spending_day": "",
+            "peak_spending_amount": 0.0,
+            "spending_trend": "stable",
+            "trend_slope_per_day": 0.0,
+            "current_period_spending": 0.0,
+            "previous_period_spending": 0.0,
+            "percentage_change": None,
+            "largest_transaction": 0.0,
+            "top_categories": {},
+            "top_merchants": {},
+        }
+
+    days = (end - start).days + 1
+    daily = spent.groupby(dates)["spent"].sum().reindex(pd.date_range(start, end, freq="D"), fill_value=0.0)
+    values = daily.to_numpy(dtype=float)
+    total = float(values.sum())
+
+    unit, label = _frequency_unit(days)
+    counts = spent.groupby(dates.dt.to_period(unit).dt.start_time)["spent"].count()
+    slope, trend = _trend(values)
+
+    half = len(values) // 2
+    previous, current = float(values[:half].sum()), float(values[half:].sum())
+
+    return {
+        "transaction_count": int(len(spent)),
+        "total_spending": round(total, 2),
+        "average_spending": {
+            "per_day": round(total / days, 2),
+            "per_week": round(total / days * 7, 2),
+            "per_month": round(total / days * 30.4375, 2),
+            "per_transaction": round(total / len(spent), 2),
+        },
+        "frequency": {period.strftime(label): int(count) for period, count in counts.items()},
+        "peak_spending_day": daily.idxmax().strftime("%Y-%m-%d"),
+        "peak_spending_amount": round(float(values.max()), 2),
+        "spending_trend": trend,
+        "trend_slope_per_day": round(slope, 4),
+        "current_period_spending": round(current, 2),
+        "previous_period_spending": round(previous, 2),
+        "percentage_change": round((current - previous) / previous * 100, 1) if previous else None,
+        "largest_transaction": round(float(spent["spent"].max()), 2),
+        "top_categories": _top(spent, "category"),
+        "top_merchants": _top(spent, "title"),
+    }
+
+
+# Rough token estimate for French/English text and CSV: ~4 characters per token
+CHARS_PER_TOKEN = 4
+# Above this many tokens of transaction rows, the rows are summarized chunk by chunk first
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "6000"))
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "4000"))
+ANALYSIS_MAP_CONCURRENCY = int(os.getenv("ANALYSIS_MAP_CONCURRENCY", "4"))
+# Merchants and days listed in the pre-aggregated tables
+AGGREGATE_ROWS = 15
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def compact_rows(frame):
+    """
+    Projects the transactions onto date, amount, category and merchant, as CSV lines
+    (no header), oldest first.
+    """
+    table = frame.sort_values("date").assign(date=frame["date"].dt.strftime("%Y-%m-%d"))
+    return table.to_csv(
+        index=False, header=False, columns=["date", "amount", "category", "title"], float_format="%.2f"
+    ).splitlines()
+
+
+def aggregate_tables(frame):
+    """
+    Pre-aggregated spending totals and counts by category, by merchant and by day, as
+    compact CSV. Only spend rows count (see _spending), so income never offsets expenses.
+    """
+    spent = _spending(frame)
+    days = spent["date"].dt.strftime("%Y-%m-%d")
+    sections = []
+    for label, key in (("category", spent["category"]), ("merchant", spent["title"]), ("day", days)):
+        grouped = spent.groupby(key, observed=True)["spent"].agg(["sum", "count"])
+        grouped = grouped.sort_values("sum", ascending=False)[:AGGREGATE_ROWS]
+        sections.append(f"by {label}: {label},spent,count\n" + grouped.to_csv(header=False, float_format="%.2f"))
+    return "\n".join(sections)
+
+
+def chunk_rows(rows, max_tokens):
+    """
+    Splits CSV lines into consecutive chunks of at most max_tokens estimated tokens.
     """
+    chunks, chunk, size = [], [], 0
+    for row in rows:
+        row_tokens = estimate_tokens(row)
+        if chunk and size + row_tokens > max_tokens:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",
+
+def _analysis_request(prompt):
+    return dict(
         messages=[{"role": "system", "content": "Analyze financial transaction data."},
                   {"role": "user", "content": prompt}],
         temperature=0.5
     )
 
-    analysis_results = response.choices[0].message.content
 
+def _complete(stage, prompt):
+    with stage_timer(stage):
+        response = route(stage, get_openai_client().chat.completions.create, _analysis_request(prompt), completion_problem)
+    return response.choices[0].message.content
+
+
+def summarize_chunk(rows):
+    """
+    Map step: notable facts about one chunk of transactions.
+    """
+    prompt = f"""
+    Below are transactions as CSV lines: date,amount,category,merchant. Negative amounts are spending.
+    {chr(10).join(rows)}
+
+    List at most 5 notable facts in one line each: unusually large transactions, recurring
+    merchants or amounts, bursts of spending on specific days. Quote exact dates and amounts.
+    No introduction, no conclusion.
+    """
+    return _complete("analysis_map", prompt)
+
+
+def transaction_context(frame):
+    """
+    Returns the transaction section of the analysis prompt: the compact rows when they fit
+    in ANALYSIS_TOKEN_BUDGET, otherwise per-chunk summaries produced in parallel, so latency
+    grows with the number of chunks rather than the raw history size.
+    """
+    rows = compact_rows(frame)
+    if sum(estimate_tokens(row) for row in rows) <= ANALYSIS_TOKEN_BUDGET:
+        return "Transactions (date,amount,category,merchant):\n" + "\n".join(rows)
+
+    chunks = chunk_rows(rows, ANALYSIS_CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=max(1, ANALYSIS_MAP_CONCURRENCY)) as executor:
+        notes = list(executor.map(summarize_chunk, chunks))
+    print(f"🧩 Summarized {len(rows)} transactions in {len(chunks)} chunks")
+    return "Notes on the transactions, period by period:\n" + "\n".join(notes)
+
+
+NO_TRANSACTIONS_MESSAGE = "No matching transactions for this period."
+
+
+def analysis_prompt(transaction_data, start_date=None, end_date=None):
+    """
+    Builds the analysis prompt from the locally computed metrics, the pre-aggregated tables
+    and a token-budgeted view of the transactions. Returns None when nothing matched.
+    """
+    frame = transactions_frame(transaction_data)
+    metrics = compute_spending_metrics(frame, start_date, end_date)
+    if not metrics["transaction_count"]:
+        return None
+
+    return f"""
+    You are an AI financial analyst. Below are spending metrics already computed from the user's transactions.
+    {json.dumps(metrics, ensure_ascii=False)}
+
+    {aggregate_tables(frame)}
+
+    {transaction_context(frame)}
+
+    - Present the top 3 highlights (3 points as a one liner) as a **brief structured summary**.
+    - Use **only the numbers above**; never compute, estimate or invent other figures.
+    - Be **clear and specific**—for example, clarify what "average" is based on.
+    - Keep sentences short and direct. **State only the key facts.**
+    - If an insight lacks a trend or pattern, **omit it.**
+    Do not include things Headings like Summary of Key Insights, or any other unnecessary information.
+    """
+
+
+# Example function to analyze transactions using OpenAI
+def analyze_transactions_with_openai(transaction_data, start_date=None, end_date=None):
+    """
+    Asks the model for the top 3 highlights of the transactions, see analysis_prompt.
+    """
+    prompt = analysis_prompt(transaction_data, start_date, end_date)
+    if prompt is None:
+        return NO_TRANSACTIONS_MESSAGE
+    return _complete("analysis", prompt)
+
+
+def stream_transactions_analysis(transaction_data, start_date=None, end_date=None):
+    """
+    Streaming counterpart of analyze_transactions_with_openai: yields the highlights text
+    piece by piece as the model produces it.
+    """
+    prompt = analysis_prompt(transaction_data, start_date, end_date)
+    if prompt is None:
+        yield NO_TRANSACTIONS_MESSAGE
+        return
 
-    return analysis_results
+    tiers = model_tiers()
+    with stage_timer("analysis"):
+        for i, model in enumerate(tiers):
+            last = i == len(tiers) - 1
+            started = time.perf_counter()
+            # Only the start of a stream can be escalated: once text reached the client, the
+            # small tier's answer is kept
+            problem, streamed, last_chunk = None, False, None
+            stream = get_openai_client().chat.completions.create(
+                model=model,
+                stream=True,
+                stream_options={"include_usage": True},
+                **_analysis_request(prompt)
+            )
+            for chunk in stream:
+                last_chunk = chunk
+                delta = chunk.choices[0].delta if chunk.choices else None
+                if delta is not None and getattr(delta, "refusal", None) and not streamed and not last:
+                    problem = "refusal"
+                    stream.close()
+                    break
+                if delta is not None and delta.content:
+                    streamed = True
+                    yield delta.content
+            if not streamed and not last and problem is None:
+                problem = "empty answer"
+            # With include_usage, the final chunk carries the token counts
+            elapsed = time.perf_counter() - started
+            record_usage("analysis", last_chunk, elapsed)
+            record("analysis", model, elapsed, problem)
+            if problem is None:
+                return
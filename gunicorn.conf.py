@@ -0,0 +1,12 @@
+# Read by gunicorn from the working directory, for `gunicorn app:app` and
+# `gunicorn asgi:app -k uvicorn.workers.UvicornWorker` alike
+from preload import PRELOAD, warm_up
+
+
+preload_app = PRELOAD
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    if PRELOAD:
+        warm_up()
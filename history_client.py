@@ -0,0 +1,138 @@
+import os
+import threading
+
+
+HISTORY_API_URL = os.getenv("HISTORY_API_URL", "https://preprod.api.lydia-app.com/history/_search")
+HISTORY_API_TOKEN = os.getenv("HISTORY_API_TOKEN", "TESTHISTORYAI3")
+HISTORY_CONNECT_TIMEOUT = float(os.getenv("HISTORY_CONNECT_TIMEOUT", "3.05"))
+HISTORY_READ_TIMEOUT = float(os.getenv("HISTORY_READ_TIMEOUT", "10"))
+HISTORY_MAX_RETRIES = int(os.getenv("HISTORY_MAX_RETRIES", "3"))
+HISTORY_POOL_SIZE = int(os.getenv("HISTORY_POOL_SIZE", "20"))
+# Transactions fetched per request when walking a whole result set
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "500"))
+# Unique field sorted on after createdAt, so transactions sharing a timestamp are never
+# skipped or repeated across a page boundary
+HISTORY_TIEBREAKER_FIELD = os.getenv("HISTORY_TIEBREAKER_FIELD", "id")
+
+
+class HistoryClient:
+    """
+    Client for the history search API over one keep-alive session, with timeouts and
+    retries with exponential backoff on connection errors, 429s and 5xx.
+    """
+
+    def __init__(self, url=None, token=None, page_size=None):
+        self.url = url or HISTORY_API_URL
+        self.token = token or HISTORY_API_TOKEN
+        self.page_size = page_size or HISTORY_PAGE_SIZE
+        self.timeout = (HISTORY_CONNECT_TIMEOUT, HISTORY_READ_TIMEOUT)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # A pooled connection must not be shared with a forked worker
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = self._new_session()
+                self._pid = os.getpid()
+            return self._session
+
+    def _new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=HISTORY_MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # _search only reads, so retrying the POST is safe
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HISTORY_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}",
+        })
+        return session
+
+    def search(self, payload):
+        """
+        Runs one search and returns the decoded response. Raises requests.HTTPError on a
+        non-2xx status once retries are exhausted.
+        """
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_transactions(self, query, page_size=None, max_items=None):
+        """
+        Yields every transaction matching an Elasticsearch query, newest first, walking the
+        result set page by page with search_after on (createdAt, tiebreaker). Only one page
+        is held in memory at a time. "from", "size" and "sort" in the query are replaced, and
+        aggregations dropped since they would be recomputed for every page.
+        """
+        payload = {key: value for key, value in query.items() if key not in ("from", "size", "sort", "aggs")}
+        payload["size"] = page_size or self.page_size
+        payload["sort"] = [
+            {"createdAt": "desc"},
+            {HISTORY_TIEBREAKER_FIELD: {"order": "asc", "unmapped_type": "keyword"}},
+        ]
+        if isinstance(payload.get("_source"), list):
+            # The cursor is rebuilt from these when the API returns flattened items
+            payload["_source"] = payload["_source"] + [
+                field for field in ("createdAt", HISTORY_TIEBREAKER_FIELD) if field not in payload["_source"]
+            ]
+
+        yielded = 0
+        while True:
+            hits = page_hits(self.search(payload))
+            for _, item in hits:
+                if max_items is not None and yielded >= max_items:
+                    return
+                yield item
+                yielded += 1
+            if len(hits) < payload["size"]:
+                return
+            cursor = hits[-1][0]
+            if cursor is None:
+                return
+            payload["search_after"] = cursor
+
+
+def page_hits(response):
+    """
+    Returns [(sort values, transaction)] from a search response, whether it is a raw
+    Elasticsearch response (hits.hits) or the history API's flattened {"items": [...]}.
+    """
+    if "hits" in response:
+        return [(hit.get("sort"), hit.get("_source", hit)) for hit in response["hits"].get("hits", [])]
+
+    hits = []
+    for item in response.get("items", []):
+        created_at = item.get("createdAt", item.get("created_at"))
+        tiebreaker = item.get(HISTORY_TIEBREAKER_FIELD)
+        cursor = item.get("sort") or ([created_at, tiebreaker] if created_at is not None and tiebreaker is not None else None)
+        hits.append((cursor, item))
+    return hits
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_history_client():
+    """
+    Returns the process-wide history client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HistoryClient()
+        return _client
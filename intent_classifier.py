@@ -0,0 +1,104 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from local_parser import fold_text
+from metrics import stage_timer
+
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(os.path.dirname(__file__), "data", "intent_model.json"))
+# Below this confidence (probability of the predicted class) the query goes to OpenAI
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+NGRAM_RANGE = (3, 5)
+
+_model = None
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def featurize(text):
+    """
+    Maps an utterance to L2-normalized counts of word unigrams and character n-grams
+    taken inside word boundaries, so accents, slang spellings and typos still overlap.
+    """
+    counts = Counter()
+    for word in re.findall(r"[a-z0-9]+", fold_text(text)):
+        counts["w:" + word] += 1
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                counts[padded[i:i + n]] += 1
+    norm = math.sqrt(sum(value * value for value in counts.values())) or 1.0
+    return {feature: value / norm for feature, value in counts.items()}
+
+
+def sigmoid(score):
+    if score < -35:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-score))
+
+
+def load_model(path=INTENT_MODEL_PATH):
+    """
+    Loads the linear model written by scripts/train_intent_classifier.py.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = load_model()
+    return _model
+
+
+def predict_proba(text, model=None):
+    """
+    Returns the probability that text is about the user's transactions.
+    """
+    model = model or get_model()
+    weights = model["weights"]
+    score = model["bias"] + sum(weights.get(feature, 0.0) * value for feature, value in featurize(text).items())
+    return sigmoid(score)
+
+
+def classify_locally(text):
+    """
+    Returns (is_transaction, confidence) from the local model alone.
+    """
+    probability = predict_proba(text)
+    return probability >= 0.5, max(probability, 1 - probability)
+
+
+async def is_transaction_query(user_input):
+    """
+    Checks if the query is transaction-related with the local classifier, and only
+    asks OpenAI when the local confidence is under INTENT_CONFIDENCE_THRESHOLD.
+    """
+    with stage_timer("classification"):
+        is_transaction, confidence = classify_locally(user_input)
+        if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+            _counters["local_yes" if is_transaction else "local_no"] += 1
+            return is_transaction
+
+        _counters["escalated"] += 1
+        # Imported here to keep the local model free of the OpenAI/Flask dependencies
+        from utils import is_transaction_query_openai
+        return await is_transaction_query_openai(user_input)
+
+
+def intent_stats():
+    """
+    Returns how many queries the local classifier answered and what fraction escalated.
+    """
+    total = sum(_counters.values())
+    stats = dict(_counters)
+    stats["threshold"] = INTENT_CONFIDENCE_THRESHOLD
+    stats["escalation_rate"] = round(_counters["escalated"] / total, 4) if total else 0.0
+    return stats
@@ -0,0 +1,295 @@
+import calendar
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+
+from constants import MOUVEMENT_TYPES
+
+
+# Words that carry no filter information once dates, amounts and scopes are removed.
+# If an utterance is made only of these, the local parse is complete and the LLM is skipped.
+FILLER_WORDS = {
+    # French
+    "a", "ai", "as", "au", "aux", "avec", "c", "ce", "ces", "chez", "combien", "d", "dans", "de", "des", "donne",
+    "du", "elle", "en", "est", "et", "il", "j", "je", "l", "la", "le", "les", "liste", "listez", "lister",
+    "ma", "me", "mes", "moi", "mon", "montre", "montrez", "affiche", "afficher", "ont", "ou", "par", "pour",
+    "qu", "que", "quel", "quelle", "quelles", "quels", "sont", "sur", "t", "tes", "toutes", "tous", "tout",
+    "toute", "un", "une", "y", "voir", "stp", "svp", "merci", "bonjour", "salut", "argent", "compte",
+    "operations", "operation", "mouvements", "mouvement", "transactions", "transaction", "historique",
+    "total", "periode", "mois", "fait", "faites", "eu", "ete",
+    # English
+    "all", "am", "and", "at", "did", "do", "for", "from", "give", "have", "how", "i", "in", "is", "list", "me", "money",
+    "much", "my", "of", "on", "please", "show", "the", "to", "was", "were", "what", "which", "during",
+    "history", "account",
+}
+
+MONTHS = {
+    "janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7, "aout": 8,
+    "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7, "august": 8,
+    "september": 9, "october": 10, "november": 11, "december": 12,
+}
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_CURRENCY = r"\s*(?:€|euros?|eur|balles|boules|balle)"
+
+AMOUNT_PATTERNS = [
+    (">", re.compile(r"(?:\b(?:plus de|au[- ]dessus de|superieure?s? a|over|more than|above|greater than)\s*|>\s*)"
+                     + _NUMBER + r"(?:" + _CURRENCY + r")?(?!\w)")),
+    ("<", re.compile(r"(?:\b(?:moins de|en[- ]dessous de|inferieure?s? a|under|less than|below)\s*|<\s*)"
+                     + _NUMBER + r"(?:" + _CURRENCY + r")?(?!\w)")),
+    ("=", re.compile(r"(?:\b(?:exactement|pile|exactly)\s*|=\s*)" + _NUMBER + r"(?:" + _CURRENCY + r")?(?!\w)")),
+    ("=", re.compile(r"(?<![\w.,])" + _NUMBER + _CURRENCY + r"(?!\w)")),
+]
+
+MATH_PATTERNS = [
+    ("COUNT", re.compile(r"\b(?:combien de (?:fois|transactions?|paiements?|achats?|operations?|virements?)|nombre de|how many)\b")),
+    ("AVG", re.compile(r"\b(?:en moyenne|moyenne?s?|average|avg|mean)\b")),
+    ("MAX", re.compile(r"\b(?:plus gros(?:se)?s?|plus grande?s?|plus chere?s?|maximum|max|highest|biggest|largest)\b")),
+    ("MIN", re.compile(r"\b(?:plus petite?s?|moins chere?s?|minimum|min|lowest|smallest)\b")),
+    ("SUM", re.compile(r"\b(?:au total|total|combien|how much|sum)\b")),
+]
+
+SCOPE_PATTERNS = [
+    ("Inter-comptes", re.compile(r"\b(?:inter[- ]?comptes?|entre mes comptes|between my accounts)\b")),
+    ("Sorties d'argent", re.compile(
+        r"\b(?:sorties? d'argent|depense[sr]?|depensee?s?|paye[sr]?|payee?s?|paiements?|achats?|achete|claque|"
+        r"spent|spend|spending|expenses?|payments?|paid|purchases?|"
+        r"retraits?|retire|dab|distributeurs?|withdrawals?|withdrew|atm)\b")),
+    ("Entrées d'argent", re.compile(
+        r"\b(?:entrees? d'argent|recus?|recues?|gagne|touche|revenus?|received|earned|income)\b")),
+]
+
+# movement_type the extract_filters prompt gives each phrasing (see its examples), checked
+# against constants.MOUVEMENT_TYPES like the model's answers
+MOVEMENT_TYPE_PATTERNS = [
+    ("atm", re.compile(r"\b(?:retraits?|retire|dab|distributeurs?|withdrawals?|withdrew|atm)\b")),
+    ("payment", re.compile(
+        r"\b(?:depense[sr]?|depensee?s?|paye[sr]?|payee?s?|paiements?|achats?|achete|claque|"
+        r"spent|spend|spending|expenses?|payments?|paid|purchases?)\b")),
+]
+assert all(value in MOUVEMENT_TYPES for value, _ in MOVEMENT_TYPE_PATTERNS)
+
+DATE_PATTERNS = [
+    ("today", re.compile(r"\b(?:aujourd'hui|aujourd hui|today)\b")),
+    ("yesterday", re.compile(r"\b(?:hier|yesterday)\b")),
+    ("last_week", re.compile(r"\b(?:(?:la )?semaine (?:derniere|passee)|last week)\b")),
+    ("this_week", re.compile(r"\b(?:cette semaine|this week)\b")),
+    ("last_month", re.compile(r"\b(?:(?:le )?mois (?:dernier|passe)|last month)\b")),
+    ("this_month", re.compile(r"\b(?:ce mois(?:[- ]ci)?|this month)\b")),
+    ("last_year", re.compile(r"\b(?:l'annee (?:derniere|passee)|annee (?:derniere|passee)|l'an (?:dernier|passe)|last year)\b")),
+    ("this_year", re.compile(r"\b(?:cette annee|this year)\b")),
+    ("last_days", re.compile(r"\b(?:(?:les|ces) )?(\d{1,3}) derniers jours\b|\b(?:the )?last (\d{1,3}) days\b")),
+    # The English modal "may" only counts as May after a preposition or before a year
+    ("month", re.compile(r"\b(?!may\b(?! 20\d{2}))(?:(?:en|in|au mois de|du mois de|de|d') ?)?("
+                         + "|".join(MONTHS) + r")(?: (20\d{2}))?\b")),
+    ("year", re.compile(r"\b(?:(?:en|in|de|pour|for) )?(20\d{2})\b")),
+]
+
+
+def fold_text(text):
+    """
+    Lowercases and strips accents so patterns only have to spell each word once.
+    """
+    text = (text or "").lower().replace("’", "'").replace("`", "'")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _blank(text, match):
+    return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+
+def _format_amount(operator, raw_value):
+    value = float(raw_value.replace(",", "."))
+    value = int(value) if value.is_integer() else value
+    return f"{operator}{value}€"
+
+
+def _month_range(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def last_complete_month(today):
+    """
+    Returns the first and last day of the last fully elapsed month.
+    """
+    end = today.replace(day=1) - timedelta(days=1)
+    return end.replace(day=1), end
+
+
+def _resolve_date(kind, match, today):
+    if kind == "today":
+        return today, today
+    if kind == "yesterday":
+        day = today - timedelta(days=1)
+        return day, day
+    if kind == "this_week":
+        return today - timedelta(days=today.weekday()), today
+    if kind == "last_week":
+        monday = today - timedelta(days=today.weekday() + 7)
+        return monday, monday + timedelta(days=6)
+    if kind == "this_month":
+        return today.replace(day=1), today
+    if kind == "last_month":
+        return last_complete_month(today)
+    if kind == "this_year":
+        return date(today.year, 1, 1), today
+    if kind == "last_year":
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    if kind == "last_days":
+        days = int(match.group(1) or match.group(2))
+        # Today is one of them
+        return today - timedelta(days=days - 1), today
+    if kind == "month":
+        month = MONTHS[match.group(1)]
+        if match.group(2):
+            year = int(match.group(2))
+        else:
+            # A month that hasn't arrived yet refers to last year's
+            year = today.year if month <= today.month else today.year - 1
+        return _month_range(year, month)
+    if kind == "year":
+        year = int(match.group(1))
+        return date(year, 1, 1), date(year, 12, 31)
+    return None
+
+
+def _extract_unique(text, patterns):
+    """
+    Finds every match of the given (value, pattern) pairs and blanks them out of text.
+    Returns the values found and the remaining text.
+    """
+    values = []
+    for value, pattern in patterns:
+        while True:
+            match = pattern.search(text)
+            if match is None:
+                break
+            values.append((value, match))
+            text = _blank(text, match)
+    return values, text
+
+
+def parse_query(user_input, today=None):
+    """
+    Resolves dates, amounts, movement scope and type and math operation from plain
+    French/English phrasing, using the same rules as the extract_filters prompt. Known merchant aliases
+    seed keywords and pfm-category.
+
+    Returns (resolved, covered): resolved holds only the fields that were confidently
+    parsed; covered is True when nothing else in the utterance needs the LLM, in which
+    case resolved is a complete response with the default date range applied.
+    """
+    if today is None:
+        today = date.today()
+    elif isinstance(today, str):
+        today = datetime.strptime(today, "%Y-%m-%d").date()
+
+    text = fold_text(user_input)
+    # Folding keeps NFC text aligned character for character, so spans map back for display
+    original = unicodedata.normalize("NFC", user_input or "")
+    if len(original) != len(text):
+        original = text
+    resolved = {}
+    ambiguous = False
+
+    # Math phrases are found before merchants, so a math word ("total") is never read as
+    # a merchant on its own; an alias that only contains one ("station total") still wins.
+    operations, _ = _extract_unique(text, MATH_PATTERNS)
+
+    # Merchants first, so names like "Optic 2000" aren't read as dates or amounts.
+    # Imported here because the matcher folds its aliases with fold_text.
+    from merchant_matcher import get_matcher
+    keywords, categories = [], []
+    for start, end, canonical, merchant_categories in get_matcher().match(text):
+        if any(match.start() <= start and end <= match.end() for _, match in operations):
+            continue
+        operations = [(value, match) for value, match in operations if match.end() <= start or end <= match.start()]
+        text = text[:start] + " " * (end - start) + text[end:]
+        if canonical not in keywords:
+            keywords.append(canonical)
+        categories.extend(c for c in merchant_categories if c not in categories)
+    if keywords:
+        resolved["keywords"] = ", ".join(keywords)
+        resolved["pfm-category"] = ", ".join(categories)
+
+    # Amounts next, so that "50 euros" is never read as a year or a bare number
+    amounts, text = _extract_unique(text, AMOUNT_PATTERNS)
+    amount_values = {_format_amount(operator, match.group(1)) for operator, match in amounts}
+    if len(amount_values) == 1:
+        resolved["amount"] = amount_values.pop()
+    elif amount_values:
+        ambiguous = True
+
+    dates, text = _extract_unique(text, DATE_PATTERNS)
+    ranges = set()
+    time_frame = ""
+    for kind, match in dates:
+        date_range = _resolve_date(kind, match, today)
+        if date_range is None or date_range[0] > today:
+            ambiguous = True
+            continue
+        ranges.add((date_range[0], min(date_range[1], today)))
+        time_frame = " ".join(original[match.start():match.end()].split())
+    if len(ranges) == 1:
+        start, end = ranges.pop()
+        resolved["time_frame"] = time_frame
+        resolved["start_date"] = start.strftime("%Y-%m-%d")
+        resolved["end_date"] = end.strftime("%Y-%m-%d")
+    elif ranges:
+        ambiguous = True
+
+    # Math phrases overlapping an amount or a date are left to those
+    operations = [(value, match) for value, match in operations if text[match.start():match.end()] == match.group(0)]
+    for _, match in operations:
+        text = _blank(text, match)
+    operation_values = {value for value, _ in operations}
+    if len(operation_values) == 1:
+        resolved["math_operation"] = operation_values.pop()
+    elif operation_values:
+        ambiguous = True
+
+    movement_types = [value for value, pattern in MOVEMENT_TYPE_PATTERNS if pattern.search(text)]
+    scopes, text = _extract_unique(text, SCOPE_PATTERNS)
+    scope_values = {value for value, _ in scopes}
+    if len(scope_values) == 1:
+        resolved["movement_scope"] = scope_values.pop()
+    elif scope_values:
+        ambiguous = True
+
+    leftover = [word for word in re.findall(r"[a-z0-9]+", text) if word not in FILLER_WORDS]
+    # Filler alone ("bonjour", "merci") or an empty input carries no filter: left to the LLM
+    covered = bool(resolved) and not ambiguous and not leftover
+    if covered and movement_types:
+        # Only on a complete parse: otherwise the rest of the query may call for another type
+        resolved["movement_type"] = ", ".join(movement_types)
+        if movement_types == ["atm"] and not categories:
+            resolved["pfm-category"] = "atm"
+    if covered:
+        resolved = complete_response(resolved, today)
+    return resolved, covered
+
+
+def complete_response(resolved, today):
+    """
+    Fills every schema field missing from resolved with its empty value, and applies the
+    prompt's default of the last complete month when no date was mentioned.
+    """
+    response = {
+        "time_frame": "",
+        "start_date": "",
+        "end_date": "",
+        "movement_type": "",
+        "pfm-category": "",
+        "movement_scope": "",
+        "math_operation": "",
+        "amount": "",
+        "keywords": "",
+    }
+    response.update(resolved)
+    if not response["start_date"] or not response["end_date"]:
+        start, end = last_complete_month(today)
+        response["start_date"] = start.strftime("%Y-%m-%d")
+        response["end_date"] = end.strftime("%Y-%m-%d")
+    return response
@@ -0,0 +1,150 @@
+import csv
+import os
+import threading
+import time
+from collections import deque
+
+from local_parser import fold_text
+
+
+MERCHANT_ALIASES_PATH = os.getenv(
+    "MERCHANT_ALIASES_PATH", os.path.join(os.path.dirname(__file__), "data", "merchant_aliases.csv")
+)
+# How often (seconds) to check the dictionary file for changes
+MERCHANT_RELOAD_INTERVAL = float(os.getenv("MERCHANT_RELOAD_INTERVAL", "10"))
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over folded aliases: finds every alias occurrence in a text
+    in one linear pass, whatever the number of aliases.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+
+    def _add(self, pattern):
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+        self.output[node].append(pattern)
+
+    def _link(self):
+        # Breadth-first, so a node's failure link is resolved before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if self.goto[fallback].get(char) != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter(self, text):
+        """
+        Yields (start, end, pattern) for every occurrence, overlapping ones included.
+        """
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for pattern in self.output[node]:
+                yield index + 1 - len(pattern), index + 1, pattern
+
+
+class MerchantMatcher:
+    """
+    Maps merchant aliases (McDo, Décat, Sécu...) to their canonical name and default
+    PFM categories.
+    """
+
+    def __init__(self, entries):
+        self.entries = {}
+        for alias, canonical, categories in entries:
+            self.entries[fold_text(alias).strip()] = (canonical, categories)
+        self.automaton = AhoCorasick(alias for alias in self.entries if alias)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(
+                (row["alias"], row["canonical"], [c for c in row["categories"].split("|") if c])
+                for row in csv.DictReader(f)
+            )
+
+    def match(self, folded_text):
+        """
+        Returns the non-overlapping, whole-word alias matches in already folded text,
+        preferring the leftmost then longest alias, as (start, end, canonical, categories).
+        """
+        candidates = []
+        for start, end, alias in self.automaton.iter(folded_text):
+            before = folded_text[start - 1] if start > 0 else " "
+            after = folded_text[end] if end < len(folded_text) else " "
+            if not before.isalnum() and not after.isalnum():
+                candidates.append((start, -end, alias))
+
+        matches, last_end = [], 0
+        for start, negative_end, alias in sorted(candidates):
+            if start >= last_end:
+                canonical, categories = self.entries[alias]
+                matches.append((start, -negative_end, canonical, categories))
+                last_end = -negative_end
+        return matches
+
+
+_matcher = None
+_matcher_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_matcher():
+    """
+    Returns the matcher for the current dictionary file. The file's mtime is checked at
+    most every MERCHANT_RELOAD_INTERVAL seconds; when it changed, a new automaton is built
+    and swapped in, so workers pick up edits without a restart.
+    """
+    global _matcher, _matcher_mtime, _checked_at
+    now = time.monotonic()
+    if _matcher is not None and now - _checked_at < MERCHANT_RELOAD_INTERVAL:
+        return _matcher
+
+    with _lock:
+        if _matcher is not None and now - _checked_at < MERCHANT_RELOAD_INTERVAL:
+            return _matcher
+        _checked_at = now
+        try:
+            mtime = os.path.getmtime(MERCHANT_ALIASES_PATH)
+        except OSError as e:
+            print(f"❌ Merchant dictionary unavailable: {e}")
+            if _matcher is None:
+                _matcher = MerchantMatcher([])
+            return _matcher
+        if mtime != _matcher_mtime:
+            started = time.perf_counter()
+            try:
+                _matcher = MerchantMatcher.from_csv(MERCHANT_ALIASES_PATH)
+                _matcher_mtime = mtime
+                print(f"🏪 Loaded {len(_matcher.entries)} merchant aliases in {(time.perf_counter() - started) * 1000:.0f}ms")
+            except (OSError, KeyError, csv.Error) as e:
+                # Keep serving the previous dictionary if the new file is broken
+                print(f"❌ Error loading merchant dictionary: {e}")
+                if _matcher is None:
+                    _matcher = MerchantMatcher([])
+        return _matcher
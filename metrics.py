@@ -0,0 +1,170 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from cache import ResultCache
+
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Generate a trace ID for every request, not only when the client sends X-Trace-Id
+TRACE_ALL_REQUESTS = os.getenv("TRACE_ALL_REQUESTS", "0") == "1"
+# USD per 1M tokens: (prompt, cached prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+_lock = threading.Lock()
+# stage -> [count per bucket..., count above the last bucket]
+_latency_buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+_latency_sums = defaultdict(float)
+_errors = defaultdict(int)
+_tokens = defaultdict(int)
+_cost = defaultdict(float)
+_routing = defaultdict(int)
+_routing_saved = defaultdict(float)
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+
+def observe(stage, seconds):
+    """
+    Adds one latency observation to the stage's histogram.
+    """
+    with _lock:
+        buckets = _latency_buckets[stage]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+        else:
+            buckets[-1] += 1
+        _latency_sums[stage] += seconds
+
+
+def count_error(stage):
+    with _lock:
+        _errors[stage] += 1
+
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Times the block into the stage's latency histogram and counts it as an error if it
+    raises. Works around both sync and awaited code.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # A cancelled extraction (off-topic query) or a closed stream is not a failure
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            count_error(stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def record_tokens(stage, model, prompt_tokens, cached_tokens, completion_tokens):
+    """
+    Counts the tokens of one OpenAI call and its estimated cost in USD.
+    Returns the cost, 0 for models without a known price.
+    """
+    prices = next((MODEL_PRICES[name] for name in sorted(MODEL_PRICES, key=len, reverse=True)
+                   if model and model.startswith(name)), None)
+    model = model or "unknown"
+    cost = 0.0
+    if prices:
+        cost = ((prompt_tokens - cached_tokens) * prices[0] + cached_tokens * prices[1]
+                + completion_tokens * prices[2]) / 1_000_000
+    with _lock:
+        _tokens[(stage, model, "uncached_prompt")] += prompt_tokens - cached_tokens
+        _tokens[(stage, model, "cached_prompt")] += cached_tokens
+        _tokens[(stage, model, "completion")] += completion_tokens
+        _cost[(stage, model)] += cost
+    return cost
+
+
+def record_routing(stage, model, outcome, saved_seconds):
+    """
+    Counts one model tier call ("answered" or "escalated") and the latency it saved, which
+    is negative for an escalated call.
+    """
+    with _lock:
+        _routing[(stage, model, outcome)] += 1
+        _routing_saved[stage] += saved_seconds
+
+
+def new_trace_id(incoming=None):
+    """
+    Starts the trace of a request: the client's X-Trace-Id when sent, else a fresh ID when
+    TRACE_ALL_REQUESTS is on. Returns the ID, or None when the request is not traced.
+    """
+    trace_id = (incoming or "").strip()[:64] or (uuid.uuid4().hex if TRACE_ALL_REQUESTS else None)
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return trace_id_var.get()
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels.items()) + "}"
+
+
+def render_metrics():
+    """
+    Returns this worker's metrics in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP spendbot_stage_latency_seconds Latency of each request stage.",
+        "# TYPE spendbot_stage_latency_seconds histogram",
+    ]
+    with _lock:
+        for stage, buckets in sorted(_latency_buckets.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f"spendbot_stage_latency_seconds_bucket{_labels(stage=stage, le=bound)} {cumulative}")
+            cumulative += buckets[-1]
+            lines.append(f"spendbot_stage_latency_seconds_bucket{_labels(stage=stage, le='+Inf')} {cumulative}")
+            lines.append(f"spendbot_stage_latency_seconds_sum{_labels(stage=stage)} {_latency_sums[stage]:.6f}")
+            lines.append(f"spendbot_stage_latency_seconds_count{_labels(stage=stage)} {cumulative}")
+
+        lines += ["# HELP spendbot_stage_errors_total Failed stage executions.",
+                  "# TYPE spendbot_stage_errors_total counter"]
+        lines += [f"spendbot_stage_errors_total{_labels(stage=stage)} {count}" for stage, count in sorted(_errors.items())]
+
+        lines += ["# HELP spendbot_openai_tokens_total OpenAI tokens by stage, model and kind.",
+                  "# TYPE spendbot_openai_tokens_total counter"]
+        lines += [f"spendbot_openai_tokens_total{_labels(stage=stage, model=model, kind=kind)} {count}"
+                  for (stage, model, kind), count in sorted(_tokens.items())]
+
+        lines += ["# HELP spendbot_openai_cost_usd_total Estimated OpenAI spend.",
+                  "# TYPE spendbot_openai_cost_usd_total counter"]
+        lines += [f"spendbot_openai_cost_usd_total{_labels(stage=stage, model=model)} {cost:.6f}"
+                  for (stage, model), cost in sorted(_cost.items())]
+
+        lines += ["# HELP spendbot_model_routing_total Model tier calls by stage, model and outcome.",
+                  "# TYPE spendbot_model_routing_total counter"]
+        lines += [f"spendbot_model_routing_total{_labels(stage=stage, model=model, outcome=outcome)} {count}"
+                  for (stage, model, outcome), count in sorted(_routing.items())]
+
+        lines += ["# HELP spendbot_model_routing_latency_saved_seconds Estimated latency saved by the small tier.",
+                  "# TYPE spendbot_model_routing_latency_saved_seconds gauge"]
+        lines += [f"spendbot_model_routing_latency_saved_seconds{_labels(stage=stage)} {saved:.6f}"
+                  for stage, saved in sorted(_routing_saved.items())]
+
+    lines += ["# HELP spendbot_cache_events_total Result cache hits, misses and evictions.",
+              "# TYPE spendbot_cache_events_total counter"]
+    for cache in ResultCache.instances:
+        for event, count in sorted(cache.stats_counters.items()):
+            lines.append(f"spendbot_cache_events_total{_labels(cache=cache.namespace, event=event)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+from schema import reponse_format
+from intent_classifier import is_transaction_query
+from utils import (
+    filters_cache,
+    prepare_extraction,
+    extract_filters_async,
+    extract_filters_openai_async,
+    store_extraction,
+    verdict_key,
+)
+
+
+# "gated" runs the off-topic classifier next to filter extraction; "direct" only extracts
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "direct")
+CLASSIFY_DEADLINE = float(os.getenv("CLASSIFY_DEADLINE", "3"))
+EXTRACT_DEADLINE = float(os.getenv("EXTRACT_DEADLINE", "15"))
+
+_branches = Counter()
+
+
+def off_topic_filters():
+    """
+    Returns an empty extraction, used when the query is not about transactions.
+    """
+    return {field: "" for field in reponse_format["required"]}
+
+
+async def classify_and_extract(user_input):
+    """
+    Launches the transaction classifier (local model, escalating to OpenAI when unsure)
+    and filter extraction at the same time.
+    Extraction is cancelled as soon as the classifier says "No"; otherwise the result is
+    returned as soon as both are in, which is extraction time on the happy path.
+
+    Returns (is_transaction, extracted_info). A classifier error or timeout fails open.
+
+    Extractions are only cached once the classifier accepted them, and the verdict is cached
+    with them, so a repeated query never skips the gate through the cache.
+    """
+    today, cache_key, extracted_data, resolved = prepare_extraction(user_input)
+    verdict = filters_cache.get(verdict_key(cache_key))
+    if verdict is False:
+        _branches["cached_rejected"] += 1
+        return False, off_topic_filters()
+    if extracted_data is not None and verdict:
+        # Answered from the cache or fully by the local parser, which only knows finance phrasing
+        _branches["local"] += 1
+        return True, dict(extracted_data)
+
+    started = time.perf_counter()
+    classify_task = asyncio.create_task(asyncio.wait_for(is_transaction_query(user_input), CLASSIFY_DEADLINE))
+    from_cache = extracted_data is not None
+    if from_cache:
+        # Cached by the ungated extract_filters: only the verdict is missing
+        extract_task = asyncio.get_running_loop().create_future()
+        extract_task.set_result(extracted_data)
+    else:
+        extract_task = asyncio.create_task(
+            asyncio.wait_for(extract_filters_openai_async(user_input, today, resolved), EXTRACT_DEADLINE)
+        )
+
+    try:
+        done, _ = await asyncio.wait({classify_task, extract_task}, return_when=asyncio.FIRST_COMPLETED)
+        if from_cache:
+            branch = "cache_unverified"
+        else:
+            branch = "classifier_first" if classify_task in done else "extraction_first"
+
+        decided = False
+        try:
+            is_transaction = await classify_task
+            decided = True
+        except asyncio.TimeoutError:
+            _branches["classifier_timeout"] += 1
+            is_transaction = True
+        except Exception as e:
+            print(f"❌ Error classifying query: {e}")
+            _branches["classifier_error"] += 1
+            is_transaction = True
+
+        if not is_transaction:
+            extract_task.cancel()
+            filters_cache.set(verdict_key(cache_key), False)
+            _branches[f"{branch}_rejected"] += 1
+            print(f"🚫 Off-topic query rejected after {time.perf_counter() - started:.2f}s ({branch})")
+            return False, off_topic_filters()
+
+        try:
+            extracted_data = await extract_task
+        except asyncio.TimeoutError:
+            _branches["extraction_timeout"] += 1
+            raise
+        store_extraction(cache_key, extracted_data)
+        if decided and "error" not in extracted_data:
+            filters_cache.set(verdict_key(cache_key), True)
+        _branches[branch] += 1
+        return True, dict(extracted_data)
+    finally:
+        for task in (classify_task, extract_task):
+            if not task.done():
+                task.cancel()
+
+
+def pipeline_stats():
+    """
+    Returns how often each branch of the gated pipeline won, for this worker.
+    """
+    return {"mode": PIPELINE_MODE, "branches": dict(_branches)}
+
+
+async def run_pipeline(user_input):
+    """
+    Extracts filters for user_input according to PIPELINE_MODE.
+    Returns (is_transaction, extracted_info).
+    """
+    if PIPELINE_MODE == "gated":
+        return await classify_and_extract(user_input)
+    return True, await extract_filters_async(user_input)
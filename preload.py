@@ -0,0 +1,39 @@
+import gc
+import os
+import time
+
+
+# Import the app and build its read-only state once in the gunicorn master, so forked
+# workers share it copy-on-write instead of each paying for it (see gunicorn.conf.py)
+PRELOAD = os.getenv("SPENDBOT_PRELOAD", "0") == "1"
+
+
+def warm_up():
+    """
+    Imports the heavy libraries and builds every read-only structure the requests use:
+    compiled prompts, constants, the intent model, the category index and the merchant
+    matcher. Then moves everything alive to the permanent GC generation, so collections
+    in the workers never touch (and so never copy) those pages.
+
+    Must not open connections: sockets and SQLite handles are created per process.
+    """
+    started = time.perf_counter()
+
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+
+    import data_analysis  # noqa: F401
+    import prompts  # noqa: F401
+    from category_index import get_category_index
+    from clients import openai_module
+    from intent_classifier import get_model
+    from merchant_matcher import get_matcher
+
+    openai_module()
+    get_category_index()
+    get_model()
+    get_matcher()
+
+    gc.collect()
+    gc.freeze()
+    print(f"🔥 Preloaded in {time.perf_counter() - started:.2f}s, {gc.get_freeze_count()} objects frozen")
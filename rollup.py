@@ -0,0 +1,276 @@
+import calendar
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+from cache import make_key
+from history_client import get_history_client
+from transaction_frame import build_transaction_frame
+from utils import (
+    HISTORY_SETTLEMENT_DAYS, MOVEMENT_SCOPE_CODES, aggregation_result, fetch_history, generate_elastic_query,
+    spend_value, stored_operation,
+)
+
+
+ROLLUP_DB_PATH = os.getenv("SPENDBOT_ROLLUP_DB", os.path.join("cache", "spendbot_rollup.sqlite3"))
+# Filter key -> rollup dimension column
+ROLLUP_DIMENSIONS = {
+    "pfm-category": "pfm_category",
+    "movement_type": "movement_type",
+    "movement_scope": "movement_scope",
+}
+ROLLUP_COLUMNS = ["id", "date", "amount", "category", "movement_type", "movement_scope"]
+
+_conn = None
+_conn_pid = None
+_lock = threading.Lock()
+_counters = {"rollup_answers": 0, "search_answers": 0, "items_applied": 0, "items_skipped": 0}
+
+
+def _db():
+    # Same rule as the result cache: never share a SQLite connection across fork()
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        directory = os.path.dirname(ROLLUP_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(ROLLUP_DB_PATH, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup ("
+            " user TEXT NOT NULL,"
+            " month TEXT NOT NULL,"
+            " pfm_category TEXT NOT NULL,"
+            " movement_type TEXT NOT NULL,"
+            " movement_scope TEXT NOT NULL,"
+            " total REAL NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " min REAL NOT NULL,"
+            " max REAL NOT NULL,"
+            " PRIMARY KEY (user, month, pfm_category, movement_type, movement_scope))"
+        )
+        # Transactions already counted, so replaying a page never counts one twice
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup_items ("
+            " user TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (user, id)) WITHOUT ROWID"
+        )
+        # Months fully loaded by a backfill; only those can answer queries
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup_months ("
+            " user TEXT NOT NULL, month TEXT NOT NULL, loaded_at REAL NOT NULL, PRIMARY KEY (user, month))"
+        )
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+
+def default_user():
+    """
+    Identifies the account the history client is authenticated as.
+    """
+    client = get_history_client()
+    return make_key(client.url, client.token)[:16]
+
+
+def apply_items(items, user=None):
+    """
+    Folds new history items into the rollup in one transaction: items are grouped by
+    month and dimensions with pandas, and each group is upserted into its running
+    sum/count/min/max. Items already applied (by id) or without an id are skipped.
+    Returns the number of items applied.
+    """
+    user = user or default_user()
+    frame = build_transaction_frame(items, columns=ROLLUP_COLUMNS).dropna(subset=["id", "date", "amount"])
+    if frame.empty:
+        return 0
+
+    with _lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            ids = frame["id"].astype(str).tolist()
+            seen = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                seen.update(row[0] for row in db.execute(
+                    f"SELECT id FROM rollup_items WHERE user = ? AND id IN ({','.join('?' * len(chunk))})",
+                    [user, *chunk],
+                ))
+            new = frame[~frame["id"].astype(str).isin(seen)].drop_duplicates("id")
+            if not new.empty:
+                db.executemany(
+                    "INSERT INTO rollup_items (user, id) VALUES (?, ?)",
+                    [(user, str(item_id)) for item_id in new["id"]],
+                )
+                groups = new.assign(
+                    month=new["date"].dt.strftime("%Y-%m"),
+                    pfm_category=new["category"].astype(object).fillna(""),
+                    movement_type=new["movement_type"].astype(object).fillna(""),
+                    movement_scope=new["movement_scope"].astype(object).fillna(""),
+                ).groupby(["month", "pfm_category", "movement_type", "movement_scope"])["amount"].agg(
+                    ["sum", "count", "min", "max"]
+                )
+                db.executemany(
+                    "INSERT INTO rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (user, month, pfm_category, movement_type, movement_scope) DO UPDATE SET"
+                    " total = total + excluded.total, count = count + excluded.count,"
+                    " min = MIN(min, excluded.min), max = MAX(max, excluded.max)",
+                    [(user, *keys, float(row["sum"]), int(row["count"]), float(row["min"]), float(row["max"]))
+                     for keys, row in groups.iterrows()],
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    _counters["items_applied"] += len(new)
+    _counters["items_skipped"] += len(frame) - len(new)
+    return len(new)
+
+
+def _month_bounds(month):
+    year, number = map(int, month.split("-"))
+    return date(year, number, 1), date(year, number, calendar.monthrange(year, number)[1])
+
+
+def is_closed(month, today=None):
+    """
+    True once no transaction can still post in the month.
+    """
+    today = today or datetime.today().date()
+    return (today - _month_bounds(month)[1]).days > HISTORY_SETTLEMENT_DAYS
+
+
+def backfill_month(month, user=None):
+    """
+    Walks every transaction of a month from the history API into the rollup. A closed
+    month is then marked loaded and answers aggregate queries from then on.
+    """
+    user = user or default_user()
+    first_day, last_day = _month_bounds(month)
+    query = generate_elastic_query({
+        "start_date": first_day.isoformat(),
+        "end_date": last_day.isoformat(),
+    })
+    query.pop("_source", None)
+
+    applied, page = 0, []
+    for item in get_history_client().iter_transactions(query):
+        page.append(item)
+        if len(page) >= 1000:
+            applied += apply_items(page, user)
+            page = []
+    applied += apply_items(page, user)
+
+    if is_closed(month):
+        with _lock:
+            _db().execute("INSERT OR REPLACE INTO rollup_months VALUES (?, ?, ?)", (user, month, time.time()))
+    print(f"📦 Rolled up {applied} transactions for {month}")
+    return applied
+
+
+def _months_between(start, end):
+    months, year, month = [], start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def plan(filters):
+    """
+    Returns (months, dimension constraints) when the filters map exactly onto the rollup:
+    an aggregate over whole calendar months, with no amount or keyword constraint.
+    Returns None otherwise.
+    """
+    if filters.get("math_operation") not in ("SUM", "COUNT", "MIN", "MAX", "AVG"):
+        return None
+    if any(filters.get(key) not in (None, "", "NULL") for key in ("amount", "keywords")):
+        return None
+    try:
+        start = datetime.strptime(filters.get("start_date", ""), "%Y-%m-%d").date()
+        end = datetime.strptime(filters.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    if start.day != 1 or end != _month_bounds(end.strftime("%Y-%m"))[1] or start > end:
+        return None
+
+    constraints = {}
+    for key, column in ROLLUP_DIMENSIONS.items():
+        value = filters.get(key)
+        if value and value != "NULL":
+            values = [v.strip() for v in value.split(",") if v.strip()]
+            if key == "movement_scope":
+                values = [MOVEMENT_SCOPE_CODES.get(v, v) for v in values]
+            constraints[column] = values
+    return _months_between(start, end), constraints
+
+
+def answer_from_rollup(filters, user=None):
+    """
+    Answers an aggregate from the rollup, in milliseconds, when the planner accepts the
+    filters and every month in the window is loaded. Returns (answered, value); value is
+    None for MIN/MAX/AVG over no transactions, and spend is positive as in the search path.
+    """
+    planned = plan(filters)
+    if planned is None:
+        return False, None
+    months, constraints = planned
+    user = user or default_user()
+
+    with _lock:
+        db = _db()
+        loaded = db.execute(
+            f"SELECT COUNT(*) FROM rollup_months WHERE user = ? AND month IN ({','.join('?' * len(months))})",
+            [user, *months],
+        ).fetchone()[0]
+        if loaded != len(months):
+            return False, None
+
+        where, params = ["user = ?", f"month IN ({','.join('?' * len(months))})"], [user, *months]
+        for column, values in constraints.items():
+            where.append(f"{column} IN ({','.join('?' * len(values))})")
+            params += values
+        total, count, minimum, maximum = db.execute(
+            f"SELECT SUM(total), SUM(count), MIN(min), MAX(max) FROM rollup WHERE {' AND '.join(where)}", params
+        ).fetchone()
+
+    count = count or 0
+    value = {
+        "SUM": total or 0.0,
+        "COUNT": count,
+        "MIN": minimum,
+        "MAX": maximum,
+        "AVG": total / count if count else None,
+    }[stored_operation(filters)]
+    return True, spend_value(filters, value)
+
+
+def aggregate(filters):
+    """
+    Query planner for math_operation questions: answers from the rollup when it can,
+    otherwise with an aggregation search. Returns (value, source).
+    """
+    answered, value = answer_from_rollup(filters)
+    if answered:
+        _counters["rollup_answers"] += 1
+        return value, "rollup"
+    _counters["search_answers"] += 1
+    response = fetch_history(generate_elastic_query(filters, aggregate_only=True))
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    value, _ = aggregation_result(response, filters)
+    return value, "search"
+
+
+def rollup_stats():
+    return dict(_counters)
+
+
+if __name__ == "__main__":
+    # Loads whole months into the rollup:  python rollup.py 2024-01 [2024-02 ...]
+    for month_arg in sys.argv[1:]:
+        backfill_month(month_arg)
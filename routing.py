@@ -0,0 +1,219 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from constants import MOUVEMENT_SCOPES, MOUVEMENT_TYPES, PFM_CATEGORIES
+from metrics import record_routing
+from schema import reponse_format
+from usage import record_usage
+
+
+# Models tried in order: the small tier answers first, the large one only on escalation
+MODEL_TIER_SMALL = os.getenv("MODEL_TIER_SMALL", "gpt-4o-mini")
+MODEL_TIER_LARGE = os.getenv("MODEL_TIER_LARGE", "gpt-4o")
+# 0 sends every call straight to the large tier, as before routing existed
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+# Below this probability on any answer token, the small model's answer counts as ambiguous
+ROUTING_MIN_TOKEN_PROB = float(os.getenv("ROUTING_MIN_TOKEN_PROB", "0.5"))
+# Large tier latency assumed per stage until one is observed, to estimate the latency saved
+ROUTING_LARGE_LATENCY_PRIOR = float(os.getenv("ROUTING_LARGE_LATENCY_PRIOR", "1.5"))
+
+AMOUNT_PATTERN = re.compile(r"^[<>=]?\s*\d+(?:[.,]\d+)?\s*€?$")
+# Allowed values of the comma-separated list fields
+ALLOWED_VALUES = {
+    "movement_type": set(MOUVEMENT_TYPES),
+    "movement_scope": set(MOUVEMENT_SCOPES),
+    "pfm-category": set(PFM_CATEGORIES),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(Counter)
+_saved_seconds = defaultdict(float)
+# Running average of the large tier latency per stage
+_large_latency = {}
+
+
+def model_tiers():
+    """
+    Returns the models to try in order.
+    """
+    if not MODEL_ROUTING or MODEL_TIER_SMALL == MODEL_TIER_LARGE:
+        return [MODEL_TIER_LARGE]
+    return [MODEL_TIER_SMALL, MODEL_TIER_LARGE]
+
+
+def min_token_probability(response):
+    """
+    Returns the lowest probability among the answer tokens, or None when the response
+    carries no logprobs.
+    """
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None)
+    if not tokens:
+        return None
+    return min(math.exp(token.logprob) for token in tokens)
+
+
+def ambiguity(response):
+    probability = min_token_probability(response)
+    if probability is not None and probability < ROUTING_MIN_TOKEN_PROB:
+        return f"ambiguous (p={probability:.2f})"
+    return None
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _items(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def filters_problem(filters, fields, resolved=None):
+    """
+    Checks extracted filters against schema.reponse_format and the allowed values in
+    constants.py. Returns the first problem found, or None when they are valid.
+    resolved holds the fields the local parser already filled: an answer that only
+    repeats them still counts as empty.
+    """
+    properties = reponse_format["properties"]
+    for field in fields:
+        value = filters.get(field)
+        if not isinstance(value, str):
+            return f"missing {field}"
+        if value and "enum" in properties[field] and value not in properties[field]["enum"]:
+            return f"invalid {field}: {value}"
+        if field in ALLOWED_VALUES and value not in ("", "NULL"):
+            unknown = [v.strip() for v in value.split(",") if v.strip() not in ALLOWED_VALUES[field]]
+            if unknown:
+                return f"invalid {field}: {', '.join(unknown)}"
+    if filters.get("amount") and not AMOUNT_PATTERN.match(filters["amount"]):
+        return f"invalid amount: {filters['amount']}"
+
+    start, end = filters.get("start_date"), filters.get("end_date")
+    if "start_date" in fields or "end_date" in fields:
+        if bool(start) != bool(end):
+            return "empty start_date or end_date"
+        if start and (_date(start) is None or _date(end) is None):
+            return f"invalid dates: {start} / {end}"
+        if start and _date(start) > _date(end):
+            return f"start_date after end_date: {start} > {end}"
+        if filters.get("time_frame") and not start:
+            return "empty dates for a time frame"
+    # Values the local parser already supplied don't count as an answer
+    resolved = resolved or {}
+    if fields and not any(set(_items(filters.get(field))) - set(_items(resolved.get(field))) for field in fields):
+        return "every field empty"
+    return None
+
+
+def completion_problem(response):
+    """
+    Checks a free-text answer: not empty, not refused and not cut off.
+    """
+    choice = response.choices[0]
+    if getattr(choice.message, "refusal", None):
+        return "refusal"
+    if choice.finish_reason == "length":
+        return "truncated"
+    if not (choice.message.content or "").strip():
+        return "empty answer"
+    return None
+
+
+def record(stage, model, elapsed, problem=None):
+    """
+    Accounts one tier's call: an answer kept from the small tier saves the large tier's
+    average latency, an escalated one costs its own latency on top.
+    """
+    with _lock:
+        counters = _counters[stage]
+        if model == MODEL_TIER_LARGE:
+            average = _large_latency.get(stage)
+            _large_latency[stage] = elapsed if average is None else 0.9 * average + 0.1 * elapsed
+            counters["large"] += 1
+            saved = 0.0
+        elif problem is None:
+            counters["small"] += 1
+            saved = _large_latency.get(stage, ROUTING_LARGE_LATENCY_PRIOR) - elapsed
+        else:
+            counters["escalated"] += 1
+            counters[f"reason:{problem.split(':')[0].split(' (')[0]}"] += 1
+            saved = -elapsed
+        _saved_seconds[stage] += saved
+    record_routing(stage, model, "escalated" if problem else "answered", saved)
+    if problem:
+        print(f"↗️ {stage}: escalating from {model}, {problem}")
+
+
+def _request(model, request, confidence, last):
+    request = dict(request, model=model)
+    if confidence and not last and ROUTING_MIN_TOKEN_PROB > 0:
+        request["logprobs"] = True
+    return request
+
+
+def route(stage, create, request, check, confidence=False):
+    """
+    Runs a chat completion on each tier in turn until one passes check(response), which
+    returns a problem string or None. The large tier's answer is always kept. With
+    confidence, the small tier is also asked for logprobs and escalates on ambiguity.
+    Errors are raised to the caller, never escalated.
+    """
+    tiers = model_tiers()
+    for i, model in enumerate(tiers):
+        last = i == len(tiers) - 1
+        started = time.perf_counter()
+        # Errors (rate limits, timeouts, connection failures) propagate: retrying them on the
+        # large tier would double the load exactly when the provider is pushing back
+        response = create(**_request(model, request, confidence, last))
+        elapsed = time.perf_counter() - started
+        record_usage(stage, response, elapsed)
+        problem = None if last else check(response) or (ambiguity(response) if confidence else None)
+        record(stage, model, elapsed, problem)
+        if problem is None:
+            return response
+
+
+async def route_async(stage, create, request, check, confidence=False):
+    """
+    Same as route, for an async create.
+    """
+    tiers = model_tiers()
+    for i, model in enumerate(tiers):
+        last = i == len(tiers) - 1
+        started = time.perf_counter()
+        response = await create(**_request(model, request, confidence, last))
+        elapsed = time.perf_counter() - started
+        record_usage(stage, response, elapsed)
+        problem = None if last else check(response) or (ambiguity(response) if confidence else None)
+        record(stage, model, elapsed, problem)
+        if problem is None:
+            return response
+
+
+def routing_stats():
+    """
+    Returns, per stage, how many calls each tier answered, the escalation rate and its
+    reasons, and the latency saved against sending everything to the large tier.
+    """
+    with _lock:
+        stats = {}
+        for stage, counters in _counters.items():
+            routed = counters["small"] + counters["escalated"]
+            stats[stage] = {
+                "small": counters["small"],
+                "escalated": counters["escalated"],
+                "large": counters["large"],
+                "escalation_rate": round(counters["escalated"] / routed, 3) if routed else 0.0,
+                "reasons": {key[len("reason:"):]: count for key, count in counters.items() if key.startswith("reason:")},
+                "latency_saved_seconds": round(_saved_seconds[stage], 3),
+            }
+        return {"tiers": model_tiers(), "stages": stats}
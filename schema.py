@@ -27,7 +27,7 @@ reponse_format = {
     },
     "math_operation": {
       "type": "string",
-      "enum": ["SUM", "MAX", "MIN", "AVG", "COUNT"],
+      "enum": ["", "SUM", "MAX", "MIN", "AVG", "COUNT"],
       "description": "The mathematical operation inferred from the query intent. Example: 'total spent' -> SUM, 'highest expense' -> MAX, 'average expense' -> AVG. If not found, return an empty string."
     },
     "amount": {
@@ -0,0 +1,280 @@
+"""
+Offline load test: starts the OpenAI and history stand-ins from stub_servers.py, boots
+gunicorn with each worker class, replays French queries against /process_text and audio
+clips against /upload_audio, and reports p50/p95/p99 latency and requests per second.
+Nothing leaves the machine and no API key is needed.
+
+    python scripts/benchmark.py --workers 2 --concurrency 4,16 --duration 20
+    python scripts/benchmark.py --worker-class sync,gthread,uvicorn --audio-dir clips/
+    python scripts/benchmark.py --compare bench_results/<older run>.json
+
+Results are saved to bench_results/<timestamp>-<git sha>.json. Caches start empty and are
+disabled unless --warm-cache is given, so every request pays the (stubbed) API latency.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_servers import HistoryStub, OpenAIStub, configure, start_server
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+CORPUS_PATH = os.path.join(ROOT, "data", "intent_corpus.tsv")
+# worker class -> (gunicorn app, extra gunicorn arguments)
+WORKER_CLASSES = {
+    "sync": ("app:app", ["-k", "sync"]),
+    "gthread": ("app:app", ["-k", "gthread", "--threads", "8"]),
+    "uvicorn": ("asgi:app", ["-k", "uvicorn.workers.UvicornWorker"]),
+}
+# Regressions above this share of the baseline are flagged by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def load_queries(path=CORPUS_PATH):
+    """
+    Returns the transaction queries (label 1) of the intent corpus.
+    """
+    with open(path, encoding="utf-8") as f:
+        rows = [line.rstrip("\n").split("\t", 1) for line in f.readlines()[1:]]
+    return [text for label, text in rows if label == "1" and text]
+
+
+def synthetic_clip(seconds=2.5, rate=16000):
+    """
+    A WAV clip of speech-like tone bursts between short silences, so the upload goes
+    through the same decoding and trimming as a real recording.
+    """
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        t = i / rate
+        envelope = 0.6 if 0.3 < t < seconds - 0.3 and int(t * 4) % 3 else 0.0
+        sample = envelope * math.sin(2 * math.pi * (180 + 40 * math.sin(3 * t)) * t)
+        frames += int(sample * 32767).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def load_clips(audio_dir=None):
+    """
+    Returns [(filename, bytes)] from audio_dir, or one synthetic clip.
+    """
+    if not audio_dir:
+        return [("clip.wav", synthetic_clip())]
+    return [
+        (name, open(os.path.join(audio_dir, name), "rb").read())
+        for name in sorted(os.listdir(audio_dir))
+        if name.lower().endswith((".wav", ".mp3", ".m4a", ".ogg", ".webm", ".flac"))
+    ]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def git_sha():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Server:
+    """
+    A gunicorn process pointed at the stubs, started and stopped as a context manager.
+    """
+
+    def __init__(self, worker_class, workers, port, env):
+        self.worker_class = worker_class
+        self.workers = workers
+        self.port = port
+        self.env = env
+        self.process = None
+
+    def __enter__(self):
+        app, extra = WORKER_CLASSES[self.worker_class]
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", app, "-b", f"127.0.0.1:{self.port}",
+             "-w", str(self.workers), "--timeout", "120", *extra],
+            cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited: {self.process.stderr.read().decode()[-2000:]}")
+            try:
+                requests.get(f"http://127.0.0.1:{self.port}/stats", timeout=2)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"gunicorn ({self.worker_class}) did not start within 60s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_load(base_url, endpoint, concurrency, duration, queries, clips):
+    """
+    Keeps `concurrency` clients busy on one endpoint for `duration` seconds. Returns the
+    latency percentiles (ms), throughput and error count.
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if endpoint == "/upload_audio":
+                    name, data = rng.choice(clips)
+                    response = session.post(base_url + endpoint, files={"audio": (name, data)}, timeout=120)
+                else:
+                    response = session.post(base_url + endpoint, data={"user_text": rng.choice(queries)}, timeout=120)
+                ok = response.status_code == 200 and "error" not in response.json()
+            except (requests.RequestException, ValueError):
+                ok = False
+            with lock:
+                (latencies if ok else errors).append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def print_table(results):
+    print(f"{'worker class':<10} {'conc':>5} {'endpoint':<15} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for row in results:
+        print(f"{row['worker_class']:<10} {row['concurrency']:>5} {row['endpoint']:<15} {row['rps']:>8} "
+              f"{row['p50_ms']!s:>9} {row['p95_ms']!s:>9} {row['p99_ms']!s:>9} {row['errors']:>7}")
+
+
+def compare(baseline_path, results):
+    """
+    Prints the change of each run against the same (worker class, concurrency, endpoint)
+    in a saved result file, flagging regressions above REGRESSION_THRESHOLD.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(row["worker_class"], row["concurrency"], row["endpoint"]): row for row in baseline["results"]}
+    print(f"\n📊 Compared with {os.path.basename(baseline_path)} ({baseline.get('git_sha')})")
+    for row in results:
+        old = previous.get((row["worker_class"], row["concurrency"], row["endpoint"]))
+        if not old or not old["p95_ms"] or not row["p95_ms"] or not old["rps"]:
+            continue
+        p95_change = row["p95_ms"] / old["p95_ms"] - 1
+        rps_change = row["rps"] / old["rps"] - 1
+        flag = "⚠️ " if p95_change > REGRESSION_THRESHOLD or rps_change < -REGRESSION_THRESHOLD else "  "
+        print(f"{flag}{row['worker_class']:<10} {row['concurrency']:>5} {row['endpoint']:<15} "
+              f"p95 {p95_change:+.1%}  rps {rps_change:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-class", default="sync,gthread,uvicorn", help="comma-separated: " + ", ".join(WORKER_CLASSES))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="4,16", help="comma-separated client counts")
+    parser.add_argument("--endpoints", default="/process_text,/upload_audio")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per run")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--audio-dir", help="directory of clips to upload instead of a synthetic one")
+    parser.add_argument("--chat-latency", type=float, default=0.8, help="median stub chat completion latency (s)")
+    parser.add_argument("--whisper-latency", type=float, default=1.2, help="median stub transcription latency (s)")
+    parser.add_argument("--history-latency", type=float, default=0.15, help="median stub history search latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.35, help="lognormal sigma of the stub latencies")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the result caches enabled")
+    parser.add_argument("--compare", help="saved result file to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    configure(args.chat_latency, args.whisper_latency, args.history_latency, args.sigma)
+    _, openai_port = start_server(OpenAIStub)
+    _, history_port = start_server(HistoryStub)
+    queries, clips = load_queries(), load_clips(args.audio_dir)
+
+    scratch = tempfile.mkdtemp(prefix="spendbot-bench-")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{openai_port}/v1",
+        HISTORY_API_URL=f"http://127.0.0.1:{history_port}/history/_search",
+        SPENDBOT_CACHE_DB=os.path.join(scratch, "cache.sqlite3"),
+        SPENDBOT_ROLLUP_DB=os.path.join(scratch, "rollup.sqlite3"),
+    )
+    if not args.warm_cache:
+        for prefix in ("FILTERS", "TRANSCRIPTION"):
+            env[f"{prefix}_CACHE_TTL"] = env[f"{prefix}_CACHE_DISK_TTL"] = "0"
+        env["HISTORY_CACHE_MEMORY_TTL"] = env["HISTORY_CACHE_OPEN_TTL"] = env["HISTORY_CACHE_CLOSED_TTL"] = "0"
+
+    results = []
+    for worker_class in args.worker_class.split(","):
+        for concurrency in map(int, args.concurrency.split(",")):
+            # A fresh server per run, so one run's backlog never bleeds into the next
+            with Server(worker_class, args.workers, args.port, env):
+                for endpoint in args.endpoints.split(","):
+                    print(f"⏱️ {worker_class} x{args.workers}, {concurrency} clients, {endpoint}...")
+                    row = run_load(f"http://127.0.0.1:{args.port}", endpoint, concurrency, args.duration, queries, clips)
+                    results.append(dict(worker_class=worker_class, workers=args.workers,
+                                        concurrency=concurrency, endpoint=endpoint, **row))
+
+    print()
+    print_table(results)
+    sha = git_sha()
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{sha}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "git_sha": sha,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "settings": {key: value for key, value in vars(args).items() if key not in ("compare", "no_save")},
+                "results": results,
+            }, f, indent=2)
+        print(f"💾 Saved {path}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
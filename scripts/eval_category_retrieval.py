@@ -0,0 +1,74 @@
+"""
+Measures the category retrieval step against the full-list baseline: recall of the
+labelled categories in data/category_eval.tsv at several k, and the prompt size sent
+to the LLM with the full list vs the top-k candidates.
+
+    python scripts/eval_category_retrieval.py [--k 5 8 12 16]
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from category_index import top_k_categories  # noqa: E402
+from constants import PFM_CATEGORIES  # noqa: E402
+from prompts import (  # noqa: E402
+    EXTRACT_FILTERS_INSTRUCTIONS,
+    EXTRACT_FILTERS_INSTRUCTIONS_TOP_K,
+    build_extract_filters_suffix,
+)
+
+
+EVAL_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "data", "category_eval.tsv"))
+
+
+def count_tokens(text):
+    try:
+        import tiktoken
+        return len(tiktoken.encoding_for_model("gpt-4o").encode(text))
+    except ImportError:
+        # Roughly 4 characters per token for mixed French/English prose
+        return len(text) // 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 8, 12, 16])
+    args = parser.parse_args()
+
+    with open(EVAL_PATH, encoding="utf-8") as f:
+        rows = [
+            (row["text"], [c for c in row["categories"].split(",") if c in PFM_CATEGORIES])
+            for row in csv.DictReader(f, delimiter="\t")
+        ]
+
+    today = "2025-01-01"
+    baseline = sum(
+        count_tokens(EXTRACT_FILTERS_INSTRUCTIONS) + count_tokens(build_extract_filters_suffix(text, today))
+        for text, _ in rows
+    ) / len(rows)
+    print(f"{len(rows)} labelled utterances; full list: recall 1.000, {baseline:.0f} prompt tokens/request")
+
+    for k in args.k:
+        found = total = tokens = 0
+        started = time.perf_counter()
+        for text, gold in rows:
+            candidates = top_k_categories(text, k)
+            found += sum(category in candidates for category in gold)
+            total += len(gold)
+        elapsed = (time.perf_counter() - started) / len(rows)
+        for text, _ in rows:
+            suffix = build_extract_filters_suffix(text, today, candidate_categories=top_k_categories(text, k))
+            tokens += count_tokens(EXTRACT_FILTERS_INSTRUCTIONS_TOP_K) + count_tokens(suffix)
+        tokens /= len(rows)
+        print(
+            f"top-{k:<3} recall {found / total:.3f}, {tokens:.0f} prompt tokens/request "
+            f"({1 - tokens / baseline:.1%} fewer), retrieval {elapsed * 1e6:.0f}µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
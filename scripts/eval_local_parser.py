@@ -0,0 +1,110 @@
+"""
+Checks the local parser against a table of utterances and the filters the extract_filters
+prompt would give them: whether the parse is complete (the LLM is skipped), and the value
+of every field it resolved. Fields left out of a row must come back empty.
+
+    python scripts/eval_local_parser.py [--verbose]
+
+Exits non-zero on any mismatch, so it can run in CI.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from local_parser import parse_query  # noqa: E402
+
+
+TODAY = "2025-06-15"
+LAST_MONTH = {"start_date": "2025-05-01", "end_date": "2025-05-31"}
+
+# (utterance, parsed completely, expected non-empty fields)
+CASES = [
+    ("dépenses du mois dernier", True,
+     {"time_frame": "mois dernier", **LAST_MONTH, "movement_type": "payment", "movement_scope": "Sorties d'argent"}),
+    ("combien j'ai dépensé en 2024", True,
+     {"time_frame": "en 2024", "start_date": "2024-01-01", "end_date": "2024-12-31", "movement_type": "payment",
+      "movement_scope": "Sorties d'argent", "math_operation": "SUM"}),
+    ("retraits du mois dernier", True,
+     {"time_frame": "mois dernier", **LAST_MONTH, "movement_type": "atm", "pfm-category": "atm",
+      "movement_scope": "Sorties d'argent"}),
+    ("paiements et retraits en mars", True,
+     {"time_frame": "en mars", "start_date": "2025-03-01", "end_date": "2025-03-31",
+      "movement_type": "atm, payment", "movement_scope": "Sorties d'argent"}),
+    ("transactions de plus de 50 euros cette semaine", True,
+     {"time_frame": "cette semaine", "start_date": "2025-06-09", "end_date": "2025-06-15", "amount": ">50€"}),
+    ("argent reçu hier", True,
+     {"time_frame": "hier", "start_date": "2025-06-14", "end_date": "2025-06-14", "movement_scope": "Entrées d'argent"}),
+    ("virements entre mes comptes en janvier", False,
+     {"time_frame": "en janvier", "start_date": "2025-01-01", "end_date": "2025-01-31", "movement_scope": "Inter-comptes"}),
+    ("how much did I spend last year", True,
+     {"time_frame": "last year", "start_date": "2024-01-01", "end_date": "2024-12-31", "movement_type": "payment",
+      "movement_scope": "Sorties d'argent", "math_operation": "SUM"}),
+    ("combien de fois chez McDo cette semaine", True,
+     {"time_frame": "cette semaine", "start_date": "2025-06-09", "end_date": "2025-06-15",
+      "pfm-category": "restaurants", "math_operation": "COUNT", "keywords": "McDonald's"}),
+    ("total Carrefour", True,
+     {**LAST_MONTH, "pfm-category": "supermarkets", "math_operation": "SUM", "keywords": "Carrefour"}),
+    ("combien au total Direct Energie en 2024", True,
+     {"time_frame": "en 2024", "start_date": "2024-01-01", "end_date": "2024-12-31", "pfm-category": "commodities",
+      "math_operation": "SUM", "keywords": "TotalEnergies Électricité"}),
+    ("plus grosse dépense chez Maxi Zoo", True,
+     {**LAST_MONTH, "movement_type": "payment", "pfm-category": "pet_stuff", "movement_scope": "Sorties d'argent",
+      "math_operation": "MAX", "keywords": "Maxi Zoo"}),
+    ("plein à la station Total en mars", False,
+     {"time_frame": "en mars", "start_date": "2025-03-01", "end_date": "2025-03-31",
+      "pfm-category": "tolls_gas_stations", "keywords": "TotalEnergies"}),
+    ("Optic 2000 en avril", True,
+     {"time_frame": "en avril", "start_date": "2025-04-01", "end_date": "2025-04-30",
+      "pfm-category": "optical_hearing, medical", "keywords": "Optic 2000"}),
+    ("mes dépenses en restaurants le mois dernier", False,
+     {"time_frame": "le mois dernier", **LAST_MONTH, "movement_scope": "Sorties d'argent"}),
+    ("remboursement de la mutuelle en mai", False,
+     {"time_frame": "en mai", **LAST_MONTH}),
+    ("les 7 derniers jours", True,
+     {"time_frame": "les 7 derniers jours", "start_date": "2025-06-09", "end_date": "2025-06-15"}),
+    ("may I see my spending", False,
+     {"movement_scope": "Sorties d'argent"}),
+    ("spending in may 2024", True,
+     {"time_frame": "in may 2024", "start_date": "2024-05-01", "end_date": "2024-05-31", "movement_type": "payment",
+      "movement_scope": "Sorties d'argent"}),
+    ("bonjour", False, {}),
+    ("", False, {}),
+    ("dépenses en décembre", True,
+     {"time_frame": "en décembre", "start_date": "2024-12-01", "end_date": "2024-12-31", "movement_type": "payment",
+      "movement_scope": "Sorties d'argent"}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every parse, not only mismatches")
+    args = parser.parse_args()
+
+    failures = covered = 0
+    started = time.perf_counter()
+    for text, expected_covered, expected in CASES:
+        resolved, is_covered = parse_query(text, TODAY)
+        covered += is_covered
+        problems = []
+        if is_covered != expected_covered:
+            problems.append(f"covered {is_covered}, expected {expected_covered}")
+        for field in sorted(set(expected) | {field for field, value in resolved.items() if value}):
+            if resolved.get(field, "") != expected.get(field, ""):
+                problems.append(f"{field}: {resolved.get(field, '')!r}, expected {expected.get(field, '')!r}")
+        failures += bool(problems)
+        if problems or args.verbose:
+            print(f"{'❌' if problems else '✅'} {text}")
+            for problem in problems:
+                print(f"    {problem}")
+    elapsed = (time.perf_counter() - started) / len(CASES)
+
+    print(f"{len(CASES) - failures}/{len(CASES)} utterances parsed as expected, "
+          f"{covered} answered without the LLM, {elapsed * 1e6:.0f}µs per parse")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures how long importing the app takes in a fresh interpreter, from `python -X importtime`,
+and fails when it goes over budget so startup regressions are caught.
+
+    python scripts/import_time.py                      # app and asgi, 5 runs each
+    python scripts/import_time.py app --budget-ms 400 --top 15
+
+OPENAI_API_KEY is removed from the environment: importing must not need it.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Median cumulative import time (ms) above which the run fails
+DEFAULT_BUDGET_MS = {"app": 450, "asgi": 650}
+
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter. Returns {imported module: (self µs, cumulative µs)}.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGET_MS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="overrides the per-module budgets")
+    parser.add_argument("--top", type=int, default=10, help="slowest dependencies to list")
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        totals, slowest = [], defaultdict(list)
+        for _ in range(args.runs):
+            times = import_times(module)
+            totals.append(times[module][1] / 1000)
+            for name, (own, _) in times.items():
+                if name.split(".")[0] != module:
+                    slowest[name.split(".")[0]].append(own / 1000)
+
+        median = statistics.median(totals)
+        budget = args.budget_ms or DEFAULT_BUDGET_MS.get(module)
+        status = "✅" if budget is None or median <= budget else "❌"
+        over_budget |= status == "❌"
+        print(f"{status} import {module}: {median:.0f} ms median over {args.runs} runs"
+              + (f" (budget {budget:.0f} ms)" if budget else ""))
+
+        # Self time summed per top-level package, so a slow SDK shows up as one line
+        packages = {name: sum(values) / args.runs for name, values in slowest.items()}
+        for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {ms:8.1f} ms  {name}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
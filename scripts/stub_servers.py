@@ -0,0 +1,278 @@
+"""
+Local stand-ins for the OpenAI API and the history _search API, so the app can be load
+tested without paid or remote calls. Point the app at them with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and HISTORY_API_URL=http://127.0.0.1:<port>/history/_search.
+
+    python scripts/stub_servers.py [--openai-port 8101] [--history-port 8102]
+                                   [--chat-latency 0.8] [--whisper-latency 1.2] [--sigma 0.35]
+
+Latencies are drawn from a lognormal distribution with the given median (seconds) and
+sigma; --sigma 0 makes them constant.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CANNED_TRANSCRIPTION = "combien j'ai dépensé en restaurants le mois dernier"
+
+
+class Latency:
+    """
+    Lognormal latency with a given median, e.g. Latency(0.8, 0.35).
+    """
+
+    def __init__(self, median, sigma=0.35):
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+
+# Plausible extract_filters answers, so routing's checks pass and the small tier answers
+# like it would on real traffic (an all-empty answer would be escalated)
+CANNED_FILTERS = {
+    "time_frame": "last month",
+    "movement_type": "payment",
+    "pfm-category": "restaurants",
+    "movement_scope": "Sorties d'argent",
+    "keywords": "Carrefour",
+}
+
+
+def canned_value(name, spec):
+    """
+    A valid value for one field of a strict JSON schema.
+    """
+    if name in CANNED_FILTERS:
+        return CANNED_FILTERS[name]
+    if "enum" in spec:
+        return "" if "" in spec["enum"] else spec["enum"][0]
+    if spec.get("type") == "number":
+        return 0
+    if spec.get("type") == "integer":
+        return 0
+    if spec.get("type") == "object":
+        return {}
+    if name == "start_date":
+        return (date.today().replace(day=1) - timedelta(days=1)).replace(day=1).isoformat()
+    if name == "end_date":
+        return (date.today().replace(day=1) - timedelta(days=1)).isoformat()
+    return ""
+
+
+def canned_completion(body):
+    """
+    Returns the message content for a chat completion request: an object matching the
+    requested json_schema, "Yes" for the yes/no classifier, or a short analysis.
+    """
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+        return json.dumps({name: canned_value(name, spec) for name, spec in schema["properties"].items()})
+    prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+    if "AI Response:" in prompt:
+        return "Yes"
+    return "- Total spending: 412.30€ over 38 transactions.\n- Peak day: 12 spent 96.10€.\n- Restaurants lead with 181.00€."
+
+
+def usage_for(body, completion):
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(completion) // 4 + 1,
+        "total_tokens": prompt_tokens + len(completion) // 4 + 1,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+class OpenAIStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    chat_latency = Latency(0.8)
+    whisper_latency = Latency(1.2)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.endswith("/audio/transcriptions"):
+            time.sleep(self.whisper_latency.sample())
+            return self._send(200, CANNED_TRANSCRIPTION, "text/plain; charset=utf-8")
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, json.dumps({"error": {"message": f"Unknown path {self.path}"}}))
+
+        body = json.loads(raw or b"{}")
+        completion = canned_completion(body)
+        time.sleep(self.chat_latency.sample())
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+        }
+        if body.get("stream"):
+            return self._stream(response, body, completion)
+        response["choices"] = [{
+            "index": 0,
+            "message": {"role": "assistant", "content": completion, "refusal": None},
+            "finish_reason": "stop",
+        }]
+        response["usage"] = usage_for(body, completion)
+        self._send(200, json.dumps(response))
+
+    def _stream(self, response, body, completion):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+        for piece in re.findall(r"\S+\s*", completion):
+            chunk = dict(response, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            write(json.dumps(chunk))
+        write(json.dumps(dict(response, object="chat.completion.chunk", choices=[],
+                              usage=usage_for(body, completion))))
+        write("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class HistoryStub(BaseHTTPRequestHandler):
+    """
+    Serves a deterministic history of `transactions_per_day` items per day, honouring
+    size, search_after and the sum/max/min/avg/value_count aggregations.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = Latency(0.15)
+    transactions_per_day = 4
+    categories = ["restaurants", "supermarkets", "transport", "shopping", "bars"]
+
+    def log_message(self, *args):
+        pass
+
+    def _transactions(self, start, end):
+        day = start
+        while day <= end:
+            for i in range(self.transactions_per_day):
+                created_at = datetime(day.year, day.month, day.day, 8 + 3 * i, tzinfo=timezone.utc)
+                seed = day.toordinal() * 10 + i
+                yield {
+                    "id": f"tx{seed}",
+                    "createdAt": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "amount": {"value": -round(5 + (seed * 7919 % 9000) / 100, 2)},
+                    "title": ["McDonald's", "Carrefour", "Uber", "Amazon", "Le Comptoir"][seed % 5],
+                    "pfm_category": self.categories[seed % len(self.categories)],
+                    "status": "done",
+                    "type": "card",
+                    "scope": "credit",
+                }
+            day += timedelta(days=1)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        time.sleep(self.latency.sample())
+
+        today = date.today()
+        start, end = today - timedelta(days=90), today
+        for clause in body.get("query", {}).get("bool", {}).get("filter", []):
+            bounds = clause.get("range", {}).get("createdAt")
+            if bounds:
+                start = date.fromisoformat(bounds.get("gte", start.isoformat())[:10])
+                end = date.fromisoformat(bounds.get("lte", end.isoformat())[:10])
+        # Same order as HistoryClient.iter_transactions: createdAt desc, then id asc
+        items = sorted(self._transactions(start, end), key=lambda item: item["id"])
+        items.sort(key=lambda item: item["createdAt"], reverse=True)
+
+        response = {"took": 1, "hits": {"hits": []}}
+        after = body.get("search_after")
+        if after:
+            items = [item for item in items
+                     if item["createdAt"] < after[0] or (item["createdAt"] == after[0] and item["id"] > after[1])]
+        for item in items[:body.get("size", 10)]:
+            response["hits"]["hits"].append({"_source": item, "sort": [item["createdAt"], item["id"]]})
+
+        metric = body.get("aggs", {}).get("result")
+        if metric:
+            (operation, _), = metric.items()
+            values = [item["amount"]["value"] for item in items]
+            value = {
+                "sum": sum(values),
+                "max": max(values, default=None),
+                "min": min(values, default=None),
+                "avg": sum(values) / len(values) if values else None,
+                "value_count": len(values),
+            }[operation]
+            response["aggregations"] = {"result": {"value": value}}
+
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(handler, port=0):
+    """
+    Starts a threaded stub server in the background. Returns (server, port).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def configure(chat_latency, whisper_latency, history_latency, sigma):
+    OpenAIStub.chat_latency = Latency(chat_latency, sigma)
+    OpenAIStub.whisper_latency = Latency(whisper_latency, sigma)
+    HistoryStub.latency = Latency(history_latency, sigma)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openai-port", type=int, default=8101)
+    parser.add_argument("--history-port", type=int, default=8102)
+    parser.add_argument("--chat-latency", type=float, default=0.8)
+    parser.add_argument("--whisper-latency", type=float, default=1.2)
+    parser.add_argument("--history-latency", type=float, default=0.15)
+    parser.add_argument("--sigma", type=float, default=0.35)
+    args = parser.parse_args()
+
+    configure(args.chat_latency, args.whisper_latency, args.history_latency, args.sigma)
+    _, openai_port = start_server(OpenAIStub, args.openai_port)
+    _, history_port = start_server(HistoryStub, args.history_port)
+    print(f"OPENAI_BASE_URL=http://127.0.0.1:{openai_port}/v1")
+    print(f"HISTORY_API_URL=http://127.0.0.1:{history_port}/history/_search")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Trains the local transaction-intent classifier on data/intent_corpus.tsv, reports
+cross-validated accuracy and escalation rate, and writes data/intent_model.json.
+
+    python scripts/train_intent_classifier.py [--threshold 0.8] [--epochs 40]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from intent_classifier import featurize, sigmoid, INTENT_CONFIDENCE_THRESHOLD  # noqa: E402
+
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+CORPUS_PATH = os.path.join(ROOT, "data", "intent_corpus.tsv")
+MODEL_PATH = os.path.join(ROOT, "data", "intent_model.json")
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [(row["text"], int(row["label"])) for row in csv.DictReader(f, delimiter="\t")]
+
+
+def train(examples, epochs=40, learning_rate=0.5, l2=1e-4, seed=0):
+    """
+    Logistic regression fitted with plain SGD over the sparse features.
+    """
+    rng = random.Random(seed)
+    featurized = [(featurize(text), label) for text, label in examples]
+    weights, bias = {}, 0.0
+    for epoch in range(epochs):
+        rng.shuffle(featurized)
+        rate = learning_rate / (1 + epoch * 0.1)
+        for features, label in featurized:
+            score = bias + sum(weights.get(feature, 0.0) * value for feature, value in features.items())
+            gradient = sigmoid(score) - label
+            bias -= rate * gradient
+            for feature, value in features.items():
+                weight = weights.get(feature, 0.0)
+                weights[feature] = weight - rate * (gradient * value + l2 * weight)
+    return {"bias": bias, "weights": weights}
+
+
+def evaluate(model, examples, threshold):
+    """
+    Returns (accuracy of the answers given locally, fraction escalated, overall accuracy).
+    """
+    local_correct = local_total = correct = 0
+    for text, label in examples:
+        features = featurize(text)
+        probability = sigmoid(model["bias"] + sum(model["weights"].get(f, 0.0) * v for f, v in features.items()))
+        prediction = int(probability >= 0.5)
+        correct += prediction == label
+        if max(probability, 1 - probability) >= threshold:
+            local_total += 1
+            local_correct += prediction == label
+    return (
+        local_correct / local_total if local_total else 0.0,
+        1 - local_total / len(examples),
+        correct / len(examples),
+    )
+
+
+def cross_validate(examples, folds, threshold, **train_args):
+    rng = random.Random(1)
+    shuffled = examples[:]
+    rng.shuffle(shuffled)
+    results = []
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        training = [example for i, example in enumerate(shuffled) if i % folds != fold]
+        results.append(evaluate(train(training, **train_args), test, threshold))
+    return [sum(values) / folds for values in zip(*results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    examples = load_corpus()
+    local_accuracy, escalation_rate, accuracy = cross_validate(
+        examples, args.folds, args.threshold, epochs=args.epochs
+    )
+    print(f"{len(examples)} examples, {args.folds}-fold CV at threshold {args.threshold}:")
+    print(f"  accuracy (no escalation):   {accuracy:.3f}")
+    print(f"  accuracy of local answers:  {local_accuracy:.3f}")
+    print(f"  traffic escalated to OpenAI: {escalation_rate:.1%}")
+
+    model = train(examples, epochs=args.epochs)
+    # Tiny weights don't move the score; dropping them keeps the bundled model small
+    weights = {feature: round(weight, 4) for feature, weight in model["weights"].items() if abs(weight) >= 1e-3}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"bias": round(model["bias"], 4), "weights": weights}, f, ensure_ascii=False, sort_keys=True)
+    print(f"Wrote {len(weights)} weights to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
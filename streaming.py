@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+
+from audio_processing import preprocess_upload
+from transaction_frame import build_transaction_frame
+from utils import extract_filters, build_filters_response, iter_history, transcribe
+
+
+# Fetch the matching history and stream the AI analysis after the filters
+ANALYSIS_STREAMING = os.getenv("ANALYSIS_STREAMING", "0") == "1"
+# Sent with every streaming response so proxies flush each event right away
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event, data):
+    """
+    Formats one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def analysis_events(extracted_info):
+    """
+    Yields the analysis text as `analysis` events, one per streamed model delta.
+    """
+    if not ANALYSIS_STREAMING:
+        return
+    try:
+        # pandas and the analysis prompts are only loaded once analysis is switched on
+        from data_analysis import stream_transactions_analysis
+
+        transactions = build_transaction_frame(iter_history(extracted_info))
+        for delta in stream_transactions_analysis(
+            transactions, extracted_info.get("start_date"), extracted_info.get("end_date")
+        ):
+            yield sse("analysis", {"delta": delta})
+    except Exception as e:
+        yield sse("error", {"stage": "analysis", "error": str(e)})
+
+
+def text_events(user_text):
+    """
+    Yields the events for a typed query: `filters` (the /process_text body) as soon as
+    extraction is done, then the analysis deltas, then `done`.
+    """
+    try:
+        extracted_info = extract_filters(user_text)
+        extracted_info["User_Message"] = user_text
+        filters = build_filters_response(extracted_info)
+    except Exception as e:
+        yield sse("error", {"stage": "filters", "error": str(e)})
+        return
+    yield sse("filters", filters)
+    yield from analysis_events(extracted_info)
+    yield sse("done", {})
+
+
+def audio_events(audio_file):
+    """
+    Yields `transcription` as soon as Whisper answers, then the text_events of it.
+    Preprocessing runs inside the stream too, so a decode failure becomes an `error` event.
+    """
+    try:
+        transcription = transcribe(*preprocess_upload(audio_file))
+        if transcription is None:
+            # transcribe logs the failure and returns None
+            raise RuntimeError("no transcription returned")
+    except Exception as e:
+        yield sse("error", {"stage": "transcription", "error": f"Error transcribing audio: {e}"})
+        return
+    yield sse("transcription", {"text": transcription})
+    yield from text_events(transcription)
+
+
+async def iterate_in_thread(events):
+    """
+    Drives a blocking event generator from async code, one item per worker-thread hop,
+    so the event loop keeps serving other requests while it waits on the network.
+    """
+    done = object()
+    while True:
+        event = await asyncio.to_thread(next, events, done)
+        if event is done:
+            return
+        yield event
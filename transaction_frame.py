@@ -0,0 +1,99 @@
+import json
+import math
+import os
+
+try:
+    import orjson
+except ImportError:  # optional, only speeds up parsing raw history bodies
+    orjson = None
+
+
+# Fields the movement type and scope are stored under in the history index
+MOVEMENT_TYPE_FIELD = os.getenv("ELASTIC_MOVEMENT_TYPE_FIELD", "type")
+MOVEMENT_SCOPE_FIELD = os.getenv("ELASTIC_MOVEMENT_SCOPE_FIELD", "scope")
+
+# column -> (paths tried in order, dtype). Dotted paths are looked up as a flat key
+# first, then walked through nested objects.
+TRANSACTION_COLUMNS = {
+    "date": (("created_at", "createdAt"), "datetime"),
+    "amount": (("amount.value", "amount"), "float"),
+    "title": (("title",), "text"),
+    "description": (("description",), "text"),
+    "payment_purpose": (("pfm.paymentPurpose.value",), "text"),
+    "user_label": (("userLabel",), "text"),
+    "receiver": (("receiver.name",), "text"),
+    "payer": (("payer.name",), "text"),
+    "category": (("pfm_category", "pfm.category.value"), "category"),
+    "status": (("status",), "category"),
+    "image": (("main_picture",), "text"),
+    "id": (("id",), "text"),
+    "movement_type": ((MOVEMENT_TYPE_FIELD,), "category"),
+    "movement_scope": ((MOVEMENT_SCOPE_FIELD,), "category"),
+}
+
+
+def _column_values(items, paths):
+    if len(paths) == 1 and "." not in paths[0]:
+        key = paths[0]
+        return [item.get(key) for item in items]
+
+    lookups = [(path, path.split(".")) for path in paths]
+
+    def get(item):
+        for path, keys in lookups:
+            value = item.get(path)
+            if value is None and len(keys) > 1:
+                value = item
+                for key in keys:
+                    value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                return value
+        return None
+
+    return [get(item) for item in items]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def load_items(source):
+    """
+    Returns the transactions of a history response given as raw JSON (bytes/str), a
+    file object, a decoded dict or any iterable of items, e.g. utils.iter_history().
+    """
+    if hasattr(source, "read"):
+        source = source.read()
+    if isinstance(source, (bytes, bytearray, memoryview, str)):
+        source = orjson.loads(source) if orjson else json.loads(source)
+    if isinstance(source, dict):
+        return source.get("items") or [hit.get("_source", hit) for hit in source.get("hits", {}).get("hits", [])]
+    return source if isinstance(source, list) else list(source)
+
+
+def build_transaction_frame(source, columns=None):
+    """
+    Builds a typed, columnar DataFrame of transactions: one pass per column straight
+    into datetime64 (UTC) dates, float64 amounts and categorical category/status.
+    Missing values are NaT/NaN/None rather than "N/A".
+    """
+    import numpy as np
+    import pandas as pd
+
+    items = load_items(source)
+    data = {}
+    for column in columns or TRANSACTION_COLUMNS:
+        paths, kind = TRANSACTION_COLUMNS[column]
+        values = _column_values(items, paths)
+        if kind == "float":
+            data[column] = np.fromiter((_float(value) for value in values), dtype=np.float64, count=len(values))
+        elif kind == "datetime":
+            data[column] = pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601")
+        elif kind == "category":
+            data[column] = pd.Categorical(values)
+        else:
+            data[column] = values
+    return pd.DataFrame(data)
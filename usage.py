@@ -0,0 +1,61 @@
+import threading
+from collections import defaultdict
+
+from metrics import record_tokens, current_trace_id
+
+
+_lock = threading.Lock()
+_totals = defaultdict(lambda: {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0,
+    "completion_tokens": 0,
+    "latency_seconds": 0.0,
+    "cost_usd": 0.0,
+})
+
+
+def record_usage(stage, response, elapsed):
+    """
+    Records the token counts reported by OpenAI for one call, and how long it took.
+    Returns the per-request figures so callers can log or return them.
+    """
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    cost = record_tokens(stage, getattr(response, "model", None), prompt_tokens, cached_tokens, completion_tokens)
+
+    with _lock:
+        totals = _totals[stage]
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_prompt_tokens"] += cached_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["latency_seconds"] += elapsed
+        totals["cost_usd"] += cost
+
+    trace = f"[{current_trace_id()}] " if current_trace_id() else ""
+    print(f"🧮 {trace}{stage}: prompt={prompt_tokens} (cached={cached_tokens}) completion={completion_tokens} in {elapsed:.2f}s")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_seconds": round(elapsed, 3),
+        "cost_usd": round(cost, 6),
+    }
+
+
+def usage_stats():
+    """
+    Returns cumulative token counts and average latency per stage for this worker.
+    """
+    with _lock:
+        stats = {}
+        for stage, totals in _totals.items():
+            stats[stage] = dict(totals)
+            requests = totals["requests"] or 1
+            stats[stage]["avg_prompt_tokens"] = round(totals["prompt_tokens"] / requests, 1)
+            stats[stage]["avg_latency_seconds"] = round(totals["latency_seconds"] / requests, 3)
+        return stats
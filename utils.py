@@ -1,250 +1,241 @@
-import openai
-import speech_recognition as sr
 import json
+import hashlib
 from datetime import datetime
 from schema import reponse_format
-import requests
 import os
-import pandas as pd
 import re
-from constants import MOUVEMENT_SCOPES, MOUVEMENT_TYPES, PFM_CATEGORIES
+from cache import ResultCache, make_key, normalize_text
+from local_parser import parse_query
+from prompts import EXTRACT_FILTERS_INSTRUCTIONS, EXTRACT_FILTERS_INSTRUCTIONS_TOP_K, build_extract_filters_suffix
+from category_index import PFM_CATEGORY_TOP_K, top_k_categories
+from metrics import stage_timer, count_error
+from clients import get_async_openai_client, get_openai_client, openai_slot
+from routing import filters_problem, route, route_async
+from history_client import get_history_client, page_hits
+from transaction_frame import build_transaction_frame, MOVEMENT_TYPE_FIELD, MOVEMENT_SCOPE_FIELD, TRANSACTION_COLUMNS
+
+
+# Extracted filters only depend on the utterance and on the date the prompt is built with
+filters_cache = ResultCache(
+    "extract_filters",
+    max_entries=int(os.getenv("FILTERS_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("FILTERS_CACHE_TTL", "3600")),
+    disk_ttl=int(os.getenv("FILTERS_CACHE_DISK_TTL", "86400")),
+)
+
+
+# Transcriptions are keyed by a hash of the (preprocessed) audio, so retries and
+# double-taps on the mic button never reach Whisper twice
+transcription_cache = ResultCache(
+    "transcriptions",
+    max_entries=int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "512")),
+    ttl=int(os.getenv("TRANSCRIPTION_CACHE_TTL", "3600")),
+    disk_ttl=int(os.getenv("TRANSCRIPTION_CACHE_DISK_TTL", "86400")),
+)
+
+
+# History responses are keyed by the canonical search; their TTL depends on whether the
+# date window is closed (see history_cache_ttl)
+HISTORY_CACHE_OPEN_TTL = int(os.getenv("HISTORY_CACHE_OPEN_TTL", "60"))
+HISTORY_CACHE_CLOSED_TTL = int(os.getenv("HISTORY_CACHE_CLOSED_TTL", str(7 * 86400)))
+# Card payments can still post a few days after they happened
+HISTORY_SETTLEMENT_DAYS = int(os.getenv("HISTORY_SETTLEMENT_DAYS", "3"))
+# Caps the in-process tier, so an invalidation made by one worker reaches the others
+# within this many seconds
+HISTORY_CACHE_MEMORY_TTL = int(os.getenv("HISTORY_CACHE_MEMORY_TTL", "60"))
+# Opt-in: answer extracted math_operations in the filters response (from the rollup, else an
+# aggregation search on the history API, which then blocks the request)
+MATH_ANSWERS = os.getenv("MATH_ANSWERS", "0") == "1"
+# Fold every fetched transaction into the rollup
+ROLLUP_FEED = os.getenv("ROLLUP_FEED", "1") == "1"
+history_cache = ResultCache(
+    "history",
+    max_entries=int(os.getenv("HISTORY_CACHE_SIZE", "1024")),
+    ttl=HISTORY_CACHE_MEMORY_TTL,
+    disk_ttl=HISTORY_CACHE_CLOSED_TTL,
+    disk_max_entries=int(os.getenv("HISTORY_CACHE_DISK_SIZE", "20000")),
+)
 
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Function to extract filters using OpenAI
+def extract_filters(user_input):
+    """
+    Extracts relevant filters from user input, serving repeated phrasings from the cache.
+    """
+    with stage_timer("extract_filters"):
+        today, cache_key, extracted_data, resolved = prepare_extraction(user_input)
+        if extracted_data is None:
+            extracted_data = extract_filters_openai(user_input, today, resolved)
+            store_extraction(cache_key, extracted_data)
+        return dict(extracted_data)
+
 
+async def extract_filters_async(user_input):
+    """
+    Async counterpart of extract_filters, for the ASGI serving mode.
+    """
+    with stage_timer("extract_filters"):
+        today, cache_key, extracted_data, resolved = prepare_extraction(user_input)
+        if extracted_data is None:
+            extracted_data = await extract_filters_openai_async(user_input, today, resolved)
+            store_extraction(cache_key, extracted_data)
+        return dict(extracted_data)
 
-if openai.api_key is None:
-    raise ValueError("❌ OPENAI_API_KEY is not set. Make sure to add it to Heroku.")
 
+# Fields whose local resolution shows the query is about transactions
+FINANCE_FIELDS = ("amount", "movement_type", "movement_scope", "math_operation", "keywords")
 
 
-# Function to extract filters using OpenAI
-def extract_filters(user_input):
+def prepare_extraction(user_input):
     """
-    Extracts relevant filters from user input using OpenAI.
+    Runs the cheap local steps of extract_filters.
+    Returns (today, cache_key, extracted_data, resolved): extracted_data is set when the
+    cache or the local parser fully answered, otherwise resolved holds the partial parse.
     """
-        # Get today's date dynamically
+    # Get today's date dynamically
     today = datetime.today().strftime("%Y-%m-%d")
 
-    prompt = f"""
-        You are an AI assistant that extracts structured information from user queries to autofill a transaction filter form.
-
-        ### Context:
-
-        - Today’s date is **{today}**. Use this to interpret time-related queries.  
-        - The user may inquire about past transactions using **formal French, slang (argot), or casual speech**.  
-        - Certain words in French can refer to **either a spending category or a specific merchant**. **Your job is to resolve these cases intelligently or request clarification if necessary.**
-        - **Avoid extracting generic finance-related terms** like "dépenses", "transactions", "paiements".
-        - **Colloquial expressions & merchant abbreviations should be mapped correctly** (e.g., *McDo → McDonald’s*, *Décat → Decathlon*).
-        - **Refund-related queries should differentiate between actual refunds and bank transfers.**
-        - **Temporal logic should be precise**:
-          - If a month is mentioned but hasn’t arrived yet, **default to the previous year**.
-          - If no date is specified, default to **the last complete month**.
-
-        ### Given Data:
-        - **movement_type:**  
-        {MOUVEMENT_TYPES}
-        - **movement_scope:**  
-        {MOUVEMENT_SCOPES}
-        - **pfm_category:**
-        {PFM_CATEGORIES}
-        ---
-
-        ### **Your Task:**
-        Extract the following structured details from the user’s query:
-
-        - **`time_frame`**: Identify the relevant time period (e.g., "last month", "this year", "this week").
-        - **`start_date` & `end_date`**: Convert the identified time frame into **YYYY-MM-DD** format.
-        - **`movement_type`**: Choose the **most relevant** category from the given list. There can be more than one category. Only select from this list {MOUVEMENT_TYPES}. Dont invent or select from any other list
-            - NEVER infer movement_type from pfm_category values.
-            - If the user mentions a term that exists ONLY in pfm_category (like "remboursement"), DO NOT set movement_type to it.
-            - If the user mentions receiving money (e.g., "j’ai reçu un remboursement"), select:
-                - "user_gain" if it’s personal income.
-                - "bank_transfer" if it’s a known financial transaction.
-            - If the refund is from an external source (e.g., "remboursement de mutuelle" or "remboursement Sécu"), select:
-                - "bank_transfer" (since it's an inbound payment from an institution).
-                - "user_gain" (if it's uncertain).
-
-        - **`pfm_category`**: Choose all the **most relevant** PFM category from the given list. Can have more than one category.
-            Choose ALL relevant categories from {PFM_CATEGORIES}.
-            If a transaction logically belongs to multiple categories, return all of them.
-            DO NOT limit to only one category if others apply.
-            Examples of multi-category assignments:
-                "remboursement de mutuelle" → ["refund", "health_insurance"]
-                "remboursement de l’assurance auto" → ["refund", "auto_insurance"]
-                "remboursement sur un voyage annulé" → ["refund", "travel_accomodation"]
-                "remboursement médical" → ["refund", "medical"]
-                "J’ai payé mon abonnement Netflix" → ["online_content", "entertainment"]
-                "J’ai commandé un Uber hier soir" → ["transportation", "taxis"]
-                "J’ai acheté un MacBook à la FNAC" → ["electronics_it_stores", "multimedia"]
-                "J’ai pris un hôtel et un billet de train pour mes vacances" → ["travel_accomodation", "travel_means"]
-                "J’ai acheté une perceuse chez Castorama" → ["diy", "electronics_it_stores"]
-                "J’ai payé mon loyer et mes charges" → ["rent", "others_housing"]
-                "J’ai envoyé de l’argent à un ami sur Lydia" → ["lydia_with_contacts", "bank_transfer"]
-                "J’ai commandé un burger sur Uber Eats" → ["food_delivery", "restaurants"]
-                "J’ai acheté des lunettes chez Afflelou" → ["optical_hearing", "medical"]
-                "J’ai mis de l’essence et payé un péage" → ["tolls_gas_stations", "commuting"]
-                "J’ai acheté des vêtements et des chaussures" → ["clothing", "shopping_center"]
-                "J’ai souscrit à un VPN et un abonnement à un site d’actualités" → ["vpns", "newspapers_magasines"]
-            DO NOT invent categories that are not in {PFM_CATEGORIES}.
-            If multiple categories are applicable, always return them all.
-        - **`movement_scope`**: Choose the **most relevant** movement scope from the given list. There can be more than one movement scope. Only select from this list {MOUVEMENT_SCOPES}.Dont invent or select from any other list
-        - **`amount`**: Extract any numerical amount mentioned (e.g., `">50€"`, `"<100€"`). The is the amount value of money paid or received for a transaction
-        - **`math_operation`**: Identify the mathematical operation implied by the query (e.g., "total spent" → `SUM`, "highest expense" → `MAX`). 
-        - **`keywords`**: Extract only transaction-relevant keywords.
-          -Extract **ONLY specific and relevant terms** as keywords that can be matched in transaction records.
-            - **DO NOT return generic words** like "dépenses", "transactions", "paiements".
-            - **DO NOT return generic terms** like "bar", "tabac" "supermache" etc. The keywords should be proper nouns(names) and not common nouns.
-            - Keywords should be proper nouns (names of people, businesses, institutions, brands, or cities).
-            - DO NOT extract generic words like "bar du coin," "proprio," "marché local," "duty-free," "garagiste," etc.
-            - Only include proper names of businesses, places, or known entities that can be matched in transaction records.
-            - The extracted keywords should be useful when matching fields like:
-            - `title`
-            - `description`
-            - `pfm.paymentRecipient.value`
-            - `pfm.paymentPurpose.value`
-            - `pfm.paymentLabelShortened.value`
-            - `userLabel`
-            ### **Examples:**
-                **User Input:** `"Dépenses McDo 2025"`
-                **Keywords:** `["McDo"]` ✅ (NOT "dépenses", NOT "2025")
-                
-                **User Input:** `"Combien j’ai dépensé chez FNAC en janvier?"`
-                **Keywords:** `["FNAC"]` ✅ (NOT "dépensé", NOT "janvier")
-                
-                **User Input:** `"Paiements au PMU la semaine dernière"`
-                **Keywords:** `["PMU"]` ✅ (NOT "paiements", NOT "semaine dernière")
-
-                **User Input:** `"2025 dépenses"`
-                **Keywords:** `[]` ❌ (NO keywords should be extracted)
-
-                **User Input:** `"Mes transactions en 2025 pour tabac au Baiona plus de 10 euros"`
-                **Keywords:** `[Baiona]` ✅ (NOT "transactions", NOT "tabac" NOT "supermarché" NOT "2025", NOT "10 euros")
-        ---
-        ### **Handling Merchant Names & Colloquial Expressions**
-        - Maintain a **mapping** of common abbreviations:
-          - *McDo* → *McDonald’s*
-          - *Décat* → *Decathlon*
-          - Sécu → Sécurité sociale
-          - Prime → Amazon Prime
-          - *Tabac* → **Should NOT be extracted as a keyword** (generic term)
-
-        ### **Handling Edge Cases:**
-        ### **When a Word Can have different pfm_category**
-        - Some words refer to **types of businesses** (category) **AND** **specific places** (beneficiary).  
-        - **Example:**  
-            - *"J’ai claqué au PMU"* → **PMU could be:**
-            - **A betting shop** (pfm_category = "betting)
-            - **A bar visit** (pfm_category = "cafes_bars")
-            - In this case return all the possible pfm_category and ask for clarification.
-            - **Clarify:**  
-            *"PMU peut être un lieu de paris ou un simple bar. À quoi faites-vous référence ?"*
-
-        - **Implicit Date Ranges:**  
-        - `"last week"` → Convert to the appropriate date range.
-        - `"January"` → Assume the most recent January unless context suggests otherwise.
-        - Do not return any dates after the present date of {today}
-
-        - **Handling Currency & Amounts:**  
-        - Extract numerical values along with their operators (`>`, `<`, `=`) and currency if mentioned.
-
-        ---
-        ### **Understanding Argot & Casual French**
-        - Recognize **French slang and casual phrases** to correctly categorize spending:
-            - *"J’ai claqué en soirée"* → `"Bars & Cafés"` or `"Nightclubs & Entertainment"`  
-            - *"J’ai mis combien au casino ?"* → **Could be "Gambling" or "Drinks at a casino"**  
-            - *"J’ai filé 50 balles à Thomas"* → **Personal payment, likely a money transfer**
-            - *"J’ai tout cramé à la FNAC"* → **Shopping, likely books/electronics**
-
-        Return a **JSON object** with the extracted values.
-
-        ---
-
-        #### **Example 1**
-        **User Input:** `"Show my payments at PMU last month over 50€."`
-        Response:
-        {{
-            "time_frame": "last month",
-            "start_date": "2024-01-01",
-            "end_date": "2024-01-31",
-            "movement_type": "payments",
-            "pfm_category": "cafes_bars, betting",
-            "movement_scope": "Sorties d'argent",
-            "math_operation": "",
-            "amount": ">50€",
-            "keywords": "PMU"
-        }}
-            **Example 2**
-            User Input: "All withdrawals over 100€ this week."
-            Response:
-            {{
-                "time_frame": "this week",
-                "start_date": "2025-02-10",
-                "end_date": "2025-02-17",
-                "movement_type": "atm",
-                "pfm_category": "atm",
-                "movement_scope": "Sorties d'argent",
-                "math_operation": "",
-                "amount": ">100€",
-                "keywords": ""
-            }}
-
-            **Example 3**
-            User Input: "Listez toutes les dépenses en nourriture et boissons du mois dernier."
-            Response:
-            {{
-                "time_frame": "last month",
-                "start_date": "2025-01-01",
-                "end_date": "2025-01-31",
-                "movement_type": "payment",
-                "pfm_category": "restaurants",
-                "movement_scope": "Sorties d'argent",
-                "math_operation": "",
-                "amount": "",
-                "keywords": ""
-            }}
-            **Example 4**
-            User Input: "How much did I spend a Baoina last month."
-            Response:
-            {{
-                "time_frame": "last month",
-                "start_date": "2025-01-01",
-                "end_date": "2025-01-31",
-                "movement_type": "payment",
-                "pfm_category": "cafes_bars, restaurants",
-                "movement_scope": "Sorties d'argent",
-                "math_operation": "",
-                "amount": "",
-                "keywords": "Baoina"
-            }}
-
-            User Input: "{user_input}"
-    """
-
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": "Extract structured data for transaction filtering."},
-                  {"role": "user", "content": prompt}],
+    cache_key = make_key(normalize_text(user_input), today)
+    cached = filters_cache.get(cache_key)
+    if cached is not None:
+        return today, cache_key, dict(cached), None
+
+    # Dates, amounts and scopes in plain phrasing are resolved locally; the LLM is
+    # only asked for what is left, or skipped when nothing is.
+    resolved, covered = parse_query(user_input, today)
+    if covered:
+        print(f"⚡ Resolved locally: {resolved}")
+        filters_cache.set(cache_key, resolved)
+        if any(resolved.get(field) for field in FINANCE_FIELDS):
+            # A resolved amount, scope, operation or merchant is finance phrasing; dates
+            # alone are not, so the gated pipeline's classifier still decides those
+            filters_cache.set(verdict_key(cache_key), True)
+        return today, cache_key, resolved, None
+    return today, cache_key, None, resolved
+
+
+def store_extraction(cache_key, extracted_data):
+    if "error" not in extracted_data:
+        filters_cache.set(cache_key, extracted_data)
+
+
+def verdict_key(cache_key):
+    """
+    Key of the gated pipeline's transaction verdict for an utterance, stored next to its
+    extraction in filters_cache.
+    """
+    return make_key(cache_key, "is_transaction")
+
+
+def schema_for_fields(fields):
+    """
+    Restricts the strict response schema to the given fields.
+    """
+    return {
+        **reponse_format,
+        "properties": {field: reponse_format["properties"][field] for field in fields},
+        "required": list(fields),
+    }
+
+
+# Fields the local parser seeds from known merchants; the LLM is still asked for them
+# and may add to them, since the utterance can name merchants outside the dictionary
+SEEDED_FIELDS = ("keywords", "pfm-category")
+
+
+def extract_filters_request(user_input, today, resolved):
+    """
+    Builds the chat completion arguments for extract_filters.
+    """
+    fields = [field for field in reponse_format["required"] if field not in resolved or field in SEEDED_FIELDS]
+    instructions, candidates = EXTRACT_FILTERS_INSTRUCTIONS, None
+    if PFM_CATEGORY_TOP_K and "pfm-category" in fields:
+        # Only the most similar categories go in the prompt instead of all of them
+        instructions, candidates = EXTRACT_FILTERS_INSTRUCTIONS_TOP_K, top_k_categories(user_input)
+    # Static instructions first and identical on every call, so the provider's prefix cache can match.
+    # The model is picked by routing.route.
+    return dict(
+        messages=[{"role": "system", "content": instructions},
+                  {"role": "user", "content": build_extract_filters_suffix(user_input, today, resolved, candidates)}],
         response_format= {
                 "type": "json_schema",
                 "json_schema": {
                     "name": "response",
-                    "schema":reponse_format,
+                    "schema":schema_for_fields(fields),
                     "strict": True
                 }},
         temperature=0
     )
 
+
+def extraction_check(request, resolved):
+    """
+    Returns the routing check of an extract_filters response: valid JSON whose requested
+    fields pass routing.filters_problem.
+    """
+    fields = request["response_format"]["json_schema"]["schema"]["required"]
+
+    def check(response):
+        try:
+            filters = json.loads(response.choices[0].message.content or "")
+        except json.JSONDecodeError:
+            return "invalid JSON"
+        return filters_problem(filters, fields, resolved)
+
+    return check
+
+
+async def create_completion_async(**request):
+    """
+    Runs a chat completion on the shared async client, within the concurrency bound.
+    """
+    async with openai_slot():
+        return await get_async_openai_client().chat.completions.create(**request)
+
+
+def parse_extracted_filters(response, resolved):
     extracted_data = response.choices[0].message.content
 
     try:
         extracted_data = json.loads(extracted_data)  # Convert response into JSON format
     except json.JSONDecodeError:
-        extracted_data = {"error": "Invalid JSON response format"}
-
+        return {"error": "Invalid JSON response format"}
+
+    for field, value in resolved.items():
+        if field in SEEDED_FIELDS and extracted_data.get(field):
+            values = [v.strip() for v in f"{value}, {extracted_data[field]}".split(",") if v.strip()]
+            extracted_data[field] = ", ".join(dict.fromkeys(values))
+        else:
+            extracted_data[field] = value
     return extracted_data
 
+
+def extract_filters_openai(user_input, today, resolved=None):
+    """
+    Extracts relevant filters from user input using OpenAI.
+    Fields already in resolved are given to the model as context and not requested again.
+    """
+    resolved = resolved or {}
+    request = extract_filters_request(user_input, today, resolved)
+    response = route("extract_filters", get_openai_client().chat.completions.create, request,
+                     extraction_check(request, resolved), confidence=True)
+    return parse_extracted_filters(response, resolved)
+
+
+async def extract_filters_openai_async(user_input, today, resolved=None):
+    """
+    Same as extract_filters_openai, on the shared async client.
+    """
+    resolved = resolved or {}
+    request = extract_filters_request(user_input, today, resolved)
+    response = await route_async("extract_filters", create_completion_async, request,
+                                 extraction_check(request, resolved), confidence=True)
+    return parse_extracted_filters(response, resolved)
+
 def record_and_transcribe():
+    # Only the local /process_audio route records from a microphone
+    import speech_recognition as sr
+
     recognizer = sr.Recognizer()
 
     with sr.Microphone() as source:
@@ -261,7 +252,7 @@ def record_and_transcribe():
         try:
             # Use OpenAI Whisper API to transcribe
             with open(audio_filename, "rb") as audio_file:
-                transcription = openai.audio.transcriptions.create(
+                transcription = get_openai_client().audio.transcriptions.create(
                     model="whisper-1",
                     file=audio_file,
                     response_format="text"
@@ -272,6 +263,14 @@ def record_and_transcribe():
             print(f"❌ Error transcribing audio: {e}")
             return None
 
+
+def yes_no_problem(response):
+    answer = (response.choices[0].message.content or "").strip().strip('".').lower()
+    if answer not in ("yes", "no"):
+        return f"unclear answer: {answer[:40]}"
+    return None
+
+
 async def is_transaction_query_openai(user_input):
     """Uses OpenAI to check if the query is transaction-related."""
     prompt = f"""
@@ -310,11 +309,16 @@ async def is_transaction_query_openai(user_input):
     AI Response:
     """
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": "Classify whether a query is related to transactions."},
-                  {"role": "user", "content": prompt}],
-        temperature=0
+    response = await route_async(
+        "classification",
+        create_completion_async,
+        dict(
+            messages=[{"role": "system", "content": "Classify whether a query is related to transactions."},
+                      {"role": "user", "content": prompt}],
+            temperature=0
+        ),
+        yes_no_problem,
+        confidence=True,
     )
 
     # Extract AI response
@@ -322,36 +326,193 @@ async def is_transaction_query_openai(user_input):
     
     return "yes" in ai_response 
 
-def transcribe(audio_file_path):
+def audio_upload(audio_file):
+    """
+    Wraps an uploaded file (werkzeug/Quart FileStorage) as the (name, stream, type) tuple
+    the OpenAI client accepts, so the upload is streamed as-is without another copy.
+    """
+    audio_file.stream.seek(0)
+    return (audio_file.filename or "recorded_audio.wav", audio_file.stream, audio_file.mimetype or "audio/wav")
+
+
+def audio_digest(file):
+    """
+    Returns the SHA-256 of an audio file tuple's bytes, leaving the stream where it was.
+    """
+    stream = file[1]
+    if isinstance(stream, bytes):
+        return hashlib.sha256(stream).hexdigest()
+    position = stream.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+def transcribe(audio_file, cache_key=None):
+    """
+    Transcribes an uploaded audio file, or a path on disk, with Whisper.
+    cache_key identifies the audio in the transcription cache (see
+    audio_processing.upload_cache_key); by default the file's bytes are hashed.
+    """
     try:
         # Use OpenAI Whisper API to transcribe
-        with open(audio_file_path, "rb") as audio_file:
-            transcription = openai.audio.transcriptions.create(
+        if isinstance(audio_file, str):
+            with open(audio_file, "rb") as f:
+                return transcribe((os.path.basename(audio_file), f, "audio/wav"))
+        file = audio_file if isinstance(audio_file, tuple) else audio_upload(audio_file)
+        with stage_timer("transcription"):
+            cache_key = cache_key or audio_digest(file)
+            cached = transcription_cache.get(cache_key)
+            if cached is not None:
+                print(f"📝 Transcribed Text (cached): {cached}")
+                return cached
+
+            transcription = get_openai_client().audio.transcriptions.create(
                 model="whisper-1",
-                file=audio_file,
+                file=file,
                 response_format="text"
             )
             print(f"📝 Transcribed Text: {transcription}")
+            transcription_cache.set(cache_key, transcription)
+            return transcription
+    except Exception as e:
+        print(f"❌ Error transcribing audio: {e}")
+        return None
+
+async def transcribe_async(audio_file, cache_key=None):
+    try:
+        file = audio_file if isinstance(audio_file, tuple) else audio_upload(audio_file)
+        with stage_timer("transcription"):
+            cache_key = cache_key or audio_digest(file)
+            cached = transcription_cache.get(cache_key)
+            if cached is not None:
+                print(f"📝 Transcribed Text (cached): {cached}")
+                return cached
+
+            async with openai_slot():
+                transcription = await get_async_openai_client().audio.transcriptions.create(
+                    model="whisper-1",
+                    file=file,
+                    response_format="text"
+                )
+            print(f"📝 Transcribed Text: {transcription}")
+            transcription_cache.set(cache_key, transcription)
             return transcription
     except Exception as e:
         print(f"❌ Error transcribing audio: {e}")
         return None
 
+def history_cache_ttl(payload, today=None):
+    """
+    Returns how long a history response may be cached: HISTORY_CACHE_CLOSED_TTL when the
+    createdAt window ended more than HISTORY_SETTLEMENT_DAYS ago (the data can no longer
+    change), HISTORY_CACHE_OPEN_TTL when it is open-ended or reaches into recent days.
+    """
+    today = today or datetime.today().date()
+    upper_bound = None
+    for clause in _query_clauses(payload.get("query", {})):
+        bounds = clause.get("range", {}).get("createdAt")
+        if bounds:
+            upper_bound = bounds.get("lte") or bounds.get("lt")
+    if not upper_bound:
+        return HISTORY_CACHE_OPEN_TTL
+    try:
+        end_date = datetime.strptime(upper_bound[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return HISTORY_CACHE_OPEN_TTL
+    if (today - end_date).days > HISTORY_SETTLEMENT_DAYS:
+        return HISTORY_CACHE_CLOSED_TTL
+    return HISTORY_CACHE_OPEN_TTL
+
+
+def _query_clauses(query):
+    clauses = [query]
+    for occurrence in ("filter", "must"):
+        clauses += query.get("bool", {}).get(occurrence, [])
+    return clauses
+
+
+def history_cache_key(payload):
+    """
+    Canonical key of a search: the same query for the same account always hashes the same,
+    whatever the order its keys were built in.
+    """
+    client = get_history_client()
+    return make_key(client.url, client.token, payload)
+
+
 def fetch_history(payload):
-    url = "https://preprod.api.lydia-app.com/history/_search"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer TESTHISTORYAI3"
-    }
-    payload = payload
+    """
+    Runs one search against the history API on the shared pooled session, serving
+    repeated searches from history_cache.
+    """
+    import requests
+
+    with stage_timer("fetch_history"):
+        cache_key = history_cache_key(payload)
+        cached = history_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            history = get_history_client().search(payload)
+        except requests.HTTPError as e:
+            count_error("fetch_history")
+            return {"error": f"Request failed with status code {e.response.status_code}", "details": e.response.text}
+        except requests.RequestException as e:
+            count_error("fetch_history")
+            return {"error": f"Request failed: {e}"}
+
+        history_cache.set(cache_key, history, ttl=history_cache_ttl(payload))
+        feed_rollup([item for _, item in page_hits(history)])
+        return history
+
 
-    response = requests.post(url, json=payload, headers=headers)
+def feed_rollup(items):
+    """
+    Folds fetched transactions into the monthly rollup, which counts each id once, so the
+    months it holds stay current between backfills. Never fails the request.
+    """
+    if not ROLLUP_FEED or not items:
+        return
+    # rollup builds on this module
+    from rollup import apply_items
+
+    try:
+        apply_items(items)
+    except Exception as e:
+        count_error("rollup_feed")
+        print(f"❌ Rollup update failed: {e}")
 
-    if response.status_code == 200:
-        return response.json()
+
+def invalidate_history(payload=None):
+    """
+    Invalidation hook: drops the cached response of one search, or every cached history
+    response when no payload is given (e.g. after a backdated transaction was booked).
+    """
+    if payload is None:
+        history_cache.clear()
     else:
-        return {"error": f"Request failed with status code {response.status_code}", "details": response.text}
-    
+        history_cache.invalidate(history_cache_key(payload))
+
+
+def iter_history(transaction_data, max_items=None):
+    """
+    Yields every transaction matching the extracted filters, page by page, instead of
+    only the newest 60 that a single fetch_history call returns.
+    """
+    page = []
+    for item in get_history_client().iter_transactions(generate_elastic_query(transaction_data), max_items=max_items):
+        page.append(item)
+        if len(page) >= 500:
+            feed_rollup(page)
+            page = []
+        yield item
+    feed_rollup(page)
+
+
 def clean_amount(amount_str):
     """
     Cleans the amount string by extracting only numeric values and converting to float.
@@ -368,7 +529,70 @@ def clean_amount(amount_str):
         return None, None  # Handle cases where parsing fails
 
     return operator, value
-def generate_elastic_query(transaction_data):
+# Extracted filter -> keyword field it is matched on in the history index
+ELASTIC_TERM_FIELDS = {
+    "movement_type": MOVEMENT_TYPE_FIELD,
+    "pfm-category": os.getenv("ELASTIC_PFM_CATEGORY_FIELD", "pfm.category.value"),
+    "movement_scope": MOVEMENT_SCOPE_FIELD,
+}
+
+MOVEMENT_SCOPE_CODES = {
+    "Entrées d'argent": "debit",
+    "Sorties d'argent": "credit",
+    "Inter-comptes": "inter"
+}
+
+# Every field build_transaction_frame reads (so also the display, the analysis breakdowns,
+# the rollup dimensions and its id dedup), in both the API's and the index's spelling
+HISTORY_SOURCE_FIELDS = list(dict.fromkeys(
+    path for paths, _ in TRANSACTION_COLUMNS.values() for path in paths
+))
+
+# math_operation -> Elasticsearch metric aggregation on amount.value
+ELASTIC_AGGREGATIONS = {
+    "SUM": "sum",
+    "MAX": "max",
+    "MIN": "min",
+    "AVG": "avg",
+    "COUNT": "value_count",
+}
+# Expenses are stored as negative amounts, so over outgoing money only the largest expense is
+# the smallest stored amount (and the other way round)
+SPEND_OPERATIONS = {"MAX": "MIN", "MIN": "MAX"}
+
+
+def spend_only(filters):
+    """
+    Returns True when the filters only cover outgoing money.
+    """
+    return (filters.get("movement_scope") or "").strip() == "Sorties d'argent"
+
+
+def stored_operation(filters):
+    """
+    Returns the math_operation to run on the stored, signed amounts for the filters.
+    """
+    operation = filters.get("math_operation")
+    return SPEND_OPERATIONS.get(operation, operation) if spend_only(filters) else operation
+
+
+def spend_value(filters, value):
+    """
+    Turns an aggregate of stored amounts into the figure to answer with: over outgoing
+    money only, spend is given as a positive number.
+    """
+    if value is None or filters.get("math_operation") == "COUNT" or not spend_only(filters):
+        return value
+    return -value
+
+
+def generate_elastic_query(transaction_data, aggregate_only=False, histogram_interval=None, count_hits=False):
+    """
+    Builds the history search for the extracted filters. When a math_operation was
+    extracted, the matching aggregation is added; with aggregate_only, no documents are
+    fetched at all. histogram_interval ("day", "week", "month"...) also breaks the
+    aggregate down over time. The total hit count is only computed when count_hits is set.
+    """
 
     def is_valid(value):
         return value and value != "NULL"
@@ -467,57 +691,100 @@ def generate_elastic_query(transaction_data):
                 }
             })
 
-    # Constructing Query
-    must_clauses = [date_range_filter, amount_filter] + multi_match_queries
-    must_clauses = [clause for clause in must_clauses if clause]  # Remove None values
+    # Exact-match constraints on the extracted movement type, PFM category and scope
+    term_filters = []
+    for key, field in ELASTIC_TERM_FIELDS.items():
+        if is_valid(transaction_data.get(key)):
+            values = [value.strip() for value in transaction_data[key].split(",") if value.strip()]
+            if key == "movement_scope":
+                values = [MOVEMENT_SCOPE_CODES.get(value, value) for value in values]
+            if values:
+                term_filters.append({"terms": {field: values}} if len(values) > 1 else {"term": {field: values[0]}})
+
+    # Constructing Query: only the keywords are scored, every other constraint is a
+    # filter so the search side can skip scoring and cache it
+    filter_clauses = [date_range_filter, amount_filter] + term_filters
+    filter_clauses = [clause for clause in filter_clauses if clause]  # Remove None values
+    bool_query = {"filter": filter_clauses}
+    if multi_match_queries:
+        bool_query["must"] = multi_match_queries
 
     elastic_query = {
         "from": 0,
         "size": 60,
         "sort": [{"createdAt": "desc"}],
+        "track_total_hits": count_hits,
+        "_source": HISTORY_SOURCE_FIELDS,
         "query": {
-            "bool": {
-                "must": must_clauses
-            }
+            "bool": bool_query
         }
     }
 
+    # Let the search side compute SUM/MAX/MIN/AVG/COUNT instead of fetching documents
+    aggregation = ELASTIC_AGGREGATIONS.get(stored_operation(transaction_data))
+    if aggregation:
+        metric = {aggregation: {"field": "amount.value"}}
+        elastic_query["aggs"] = {"result": metric}
+        if histogram_interval:
+            histogram = {"field": "createdAt", "calendar_interval": histogram_interval, "min_doc_count": 0}
+            if date_range_filter:
+                histogram["extended_bounds"] = {
+                    "min": transaction_data["start_date"],
+                    "max": transaction_data["end_date"],
+                }
+                histogram["format"] = "yyyy-MM-dd"
+            elastic_query["aggs"]["over_time"] = {"date_histogram": histogram, "aggs": {"result": metric}}
+        if aggregate_only:
+            elastic_query["size"] = 0
+            del elastic_query["from"], elastic_query["sort"], elastic_query["_source"]
+
     return elastic_query
 
+
+def aggregation_result(response, filters=None):
+    """
+    Reads the math_operation aggregate out of a search response built by
+    generate_elastic_query. Returns (value, [(bucket date, value)]), with an empty
+    list when no date histogram was requested. Amounts keep their stored sign, unless
+    the filters it was built from are passed: spend is then positive (see spend_value).
+    """
+    filters = filters or {}
+    aggregations = response.get("aggregations", {})
+    value = spend_value(filters, aggregations.get("result", {}).get("value"))
+    buckets = [
+        (bucket.get("key_as_string", bucket.get("key")), spend_value(filters, bucket.get("result", {}).get("value")))
+        for bucket in aggregations.get("over_time", {}).get("buckets", [])
+    ]
+    return value, buckets
+
+# Column labels of the table shown to users
+DISPLAY_COLUMNS = {
+    "date": "Date",
+    "amount": "Amount (€)",
+    "title": "Title",
+    "description": "Description",
+    "payment_purpose": "Payment Purpose",
+    "user_label": "User Label",
+    "receiver": "Receiver",
+    "payer": "Payer",
+    "category": "Category",
+    "status": "Status",
+    "image": "Image",
+}
+
+
 def format_transaction_data(transaction_data):
     """
     Formats transaction data into a DataFrame for clear tabular display.
     """
-    rows = []
-    
-    for item in transaction_data.get("items", []):
-        row = {
-            "Date": item.get("created_at", "N/A"),
-            "Amount (€)": item.get("amount", "N/A"),
-            "Title": item.get("title", "N/A"),
-            "Description": item.get("description", "N/A"),
-            "Payment Purpose": item.get("pfm.paymentPurpose.value", "N/A"),
-            "User Label": item.get("userLabel", "N/A"),
-            "Receiver": item.get("receiver", {}).get("name", "N/A"),
-            "Payer": item.get("payer", {}).get("name", "N/A"),
-            "Category": item.get("pfm_category", "N/A"),
-            "Status": item.get("status", "N/A"),
-            "Image": item.get("main_picture", "N/A")
-        }
-        rows.append(row)
+    return build_transaction_frame(transaction_data, columns=list(DISPLAY_COLUMNS)).rename(columns=DISPLAY_COLUMNS)
+
 
-    df = pd.DataFrame(rows)
-    return df
 def create_advanced_search_url(base_url, filters):
 
     url = f"{base_url}?advanced_search"
-    movement_scope_map = {
-        "Entrées d'argent": "debit",
-        "Sorties d'argent": "credit",
-        "Inter-comptes": "inter"
-    }
 
-    movement_scope = movement_scope_map.get(filters["movement_scope"], None)
+    movement_scope = MOVEMENT_SCOPE_CODES.get(filters["movement_scope"], None)
 
     # Add filters to the URL
     if 'start_date' in filters and filters['start_date']:
@@ -549,4 +816,55 @@ def create_advanced_search_url(base_url, filters):
     if 'pfm_category' in filters and filters['pfm_category'] and filters['pfm_category'] != "NULL":
         url += f"&movement_scope={filters['pfm_category']}"
 
-    return url
\ No newline at end of file
+    return url
+
+ANDROID_URL = "lydia://advanced_search"
+IOS_URL = "com.lydia-app.preprod://advanced_search"
+
+
+def answer_math_operation(extracted_info):
+    """
+    Answers an extracted math_operation through rollup.aggregate: from the rollup for whole
+    loaded months, otherwise with an aggregation search. Returns {"value", "source"},
+    {"error"} on failure, or None when there is nothing to compute.
+    """
+    if not MATH_ANSWERS or extracted_info.get("math_operation") not in ELASTIC_AGGREGATIONS:
+        return None
+    from rollup import aggregate
+
+    try:
+        with stage_timer("math_answer"):
+            value, source = aggregate(extracted_info)
+    except Exception as e:
+        print(f"❌ Error computing {extracted_info['math_operation']}: {e}")
+        return {"error": str(e)}
+    return {"value": value, "source": source}
+
+
+def build_filters_response(extracted_info, answer_math=True):
+    """
+    Builds the JSON body returned to the frontend from the extracted filters, with the
+    answer to its math_operation when MATH_ANSWERS is on and answer_math is set.
+    """
+    with stage_timer("create_advanced_search_url"):
+        query_url_android = create_advanced_search_url(ANDROID_URL, extracted_info)
+        query_url_ios = create_advanced_search_url(IOS_URL, extracted_info)
+    return {
+        "clarification_needed": extracted_info.get("clarification_needed", []),
+        "clarification_options": extracted_info.get("clarification_options", []),
+        # "items": history.get("items", []),
+        # "analysis": analysis_results,  # Pass AI-generated financial insights
+        "filters": {
+            "start_date": extracted_info.get("start_date", ""),
+            "end_date": extracted_info.get("end_date", ""),
+            "amount": extracted_info.get("amount", ""),
+            "math": extracted_info.get("math_operation", ""),
+            "movement_type": extracted_info.get("movement_type", ""),
+            "pfm_category": extracted_info.get("pfm-category", ""),
+            "movement_scope": extracted_info.get("movement_scope", ""),
+            "keywords": extracted_info.get("keywords", "")
+        },
+        "query_url_android": query_url_android,
+        "query_url_ios": query_url_ios,
+        "math_result": answer_math_operation(extracted_info) if answer_math else None
+    }